@@ -6,7 +6,10 @@ from wpilib import SmartDashboard
 
 from robotenums import *
 
-import pickle
+import robotmap
+import trajectoryfile
+from trajectorycache import TrajectoryCache
+from trajectories import AutoTrajectories
 
 class Auto1():
     def __init__(self, robot, logger):
@@ -15,11 +18,20 @@ class Auto1():
         self.timer = Timer()
 
         if not self.robot.isSimulation():
-            with open("/home/lvuser/traj", "rb") as fp:
-                self.trajectory = pickle.load(fp)
+            directory = "/home/lvuser/trajectories"
         else:
-            with open("/home/ubuntu/traj", "rb") as fp:
-                self.trajectory = pickle.load(fp)
+            directory = "/home/ubuntu/trajectories"
+
+        #Every route is loaded (or generated, the first time) now, so
+        #picking one in init() is only a lookup
+        units_per_foot = trajectoryfile.units_per_foot(robotmap.DRIVE_ENCODER_COUNTS_PER_REV, robotmap.WHEEL_DIAMETER)
+        self.trajectories = TrajectoryCache(directory, units_per_foot, logger=self.logger)
+        for route in self.routes():
+            try:
+                self.trajectories.get(route)
+            except Exception as e:
+                self.logger.error("<Auto1> Couldn't load a trajectory: " + str(e))
+        self.trajectory = None
 
         self.target_chooser = sendablechooser.SendableChooser()
         self.target_chooser.setDefaultOption(TargetHeight.LOW.name, TargetHeight.LOW)
@@ -30,26 +42,43 @@ class Auto1():
         self.left_right_chooser.setDefaultOption(RightLeft.RIGHT.name, RightLeft.RIGHT)
         self.left_right_chooser.addOption(RightLeft.LEFT.name, RightLeft.LEFT)
 
+        self.near_far_chooser = sendablechooser.SendableChooser()
+        self.near_far_chooser.setDefaultOption(NearFar.NEAR.name, NearFar.NEAR)
+        self.near_far_chooser.addOption(NearFar.FAR.name, NearFar.FAR)
+
         self.hab_level_chooser = sendablechooser.SendableChooser()
         self.hab_level_chooser.setDefaultOption(HabLevel.LEVEL1.name, HabLevel.LEVEL1)
         self.hab_level_chooser.addOption(HabLevel.LEVEL2.name, HabLevel.LEVEL2)
 
         SmartDashboard.putData("TargetChooser", self.target_chooser)
         SmartDashboard.putData("LeftRightChooser", self.left_right_chooser)
+        SmartDashboard.putData("NearFarChooser", self.near_far_chooser)
         SmartDashboard.putData("HabLevelChooser", self.hab_level_chooser)
 
         self.chosen_target = TargetHeight.LOW
         self.left_right = RightLeft.RIGHT
+        self.near_far = NearFar.NEAR
         self.hab_level = HabLevel.LEVEL1
 
+    #The AutoTrajectories waypoints for a start side and rocket hatch
+    def route(self, left_right, near_far):
+        name = ("Right" if left_right == RightLeft.RIGHT else "Left") + "Rocket" + ("Near" if near_far == NearFar.NEAR else "Far")
+        return getattr(AutoTrajectories, name)
+
+    def routes(self):
+        return [self.route(left_right, near_far) for left_right in RightLeft for near_far in NearFar]
+
     def init(self):
         self.logger.info("Initializing auto 1")
 
         self.chosen_target = self.target_chooser.getSelected()
         self.left_right = self.left_right_chooser.getSelected()
+        self.near_far = self.near_far_chooser.getSelected()
         self.hab_level = self.hab_level_chooser.getSelected()
 
-        self.logger.info("<Auto1> " + self.hab_level.name + ", " + self.left_right.name + ", " + self.chosen_target.name)
+        self.logger.info("<Auto1> " + self.hab_level.name + ", " + self.left_right.name + ", " + self.near_far.name + ", " + self.chosen_target.name)
+
+        self.trajectory = self.trajectories.get(self.route(self.left_right, self.near_far))
 
         self.state = 0
         self.timer.start()
@@ -80,7 +109,7 @@ class Auto1():
                 self.state = 4
 
         elif self.state == 4:
-            self.robot.drive.follow_a_path(self.trajectory)
+            self.robot.drive.follow_compiled_path(self.trajectory)
             self.state = 5
 
         elif self.state == 5:
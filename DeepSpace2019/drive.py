@@ -1,5 +1,8 @@
 
 import math
+import collections
+import threading
+import time
 
 import wpilib
 from wpilib import SmartDashboard
@@ -7,6 +10,8 @@ from wpilib import SmartDashboard
 import ctre
 import robotmap
 from robotenums import DriveState
+from purepursuit import TankOdometry
+import trajectoryfile
 
 from ctre.pigeonimu import PigeonIMU
 from ctre.pigeonimu import PigeonIMU_StatusFrame
@@ -15,6 +20,11 @@ import pathfinder as pf
 
 class DeepSpaceDrive():
   USING_MOTION_ARC = False
+  HEADING_HISTORY_LENGTH = 50 # one second of robot loops
+  MP_START_THRESHOLD = 20 # bottom buffer points before execution starts
+  MP_BOTTOM_BUFFER_TARGET = 50
+  MP_LEAD_POINTS = 100 # points pushed ahead of the one executing, 2 seconds at 20ms
+  MP_PUSH_BUDGET = 0.002 # seconds of pushing every feeder tick
 
   def __init__(self, logger):
     self.logger = logger
@@ -27,8 +37,29 @@ class DeepSpaceDrive():
 
     self.current_state = DriveState.OPERATOR_CONTROL
 
+    '''1 driving forward, -1 backward, 0 not known yet.  Tells vision which camera to favour'''
+    self.drive_direction = 0
+
     self.pigeon = PigeonIMU(robotmap.PIGEON_IMU_CAN_ID)
 
+    '''(FPGA time, yaw in degrees) for every loop, used to line vision results up with where we were pointing'''
+    self.heading_history = collections.deque(maxlen=self.HEADING_HISTORY_LENGTH)
+
+    self.odometry = TankOdometry()
+    self.follower = None
+
+    '''
+    Moves points from the top buffers into the Talons at twice the point
+    rate, on its own thread, while the main loop only waits for mp_ready
+    '''
+    self.mp_ready = threading.Event()
+    self.leftMPStatus = None
+    self.rightMPStatus = None
+    self.feeder_running = False
+    self.feeder = wpilib.Notifier(self.feed_motion_profile)
+    self.mp_points = None
+    self.mp_points_pushed = 0
+
     self.leftTalonMaster = ctre.WPI_TalonSRX(robotmap.DRIVE_LEFT_MASTER_CAN_ID)
     self.leftTalonSlave = ctre.WPI_TalonSRX(robotmap.DRIVE_LEFT_SLAVE_CAN_ID)
 
@@ -136,15 +167,22 @@ class DeepSpaceDrive():
     self.drive.arcadeDrive(value, 0, False)
 
   def iterate(self, robot_mode, pilot_stick, copilot_stick):
+    self.heading_history.append((self.timer.getFPGATimestamp(), self.pigeon.getYawPitchRoll()[0]))
+
     pilot_x = pilot_stick.LeftStickX()
     pilot_y = pilot_stick.LeftStickY()
 
     if abs(pilot_x) > 0 or abs(pilot_y) > 0:
       self.current_state = DriveState.OPERATOR_CONTROL
+      self.stop_feeder()
       self.drive.arcadeDrive(pilot_x, pilot_y, False)
+      if abs(pilot_x) > 0:
+        self.drive_direction = 1 if pilot_x > 0 else -1
     else:
       if self.current_state == DriveState.FOLLOW_PATH:
         self.process_auto_path()
+      elif self.current_state == DriveState.PURE_PURSUIT:
+        self.process_pure_pursuit()
 
     if pilot_stick.X().get():
       self.drive_front_extend.set(True)
@@ -166,39 +204,25 @@ class DeepSpaceDrive():
 
   def disable(self):
     self.logger.info("DeepSpaceDrive::disable()")
+    self.stop_feeder()
   
   def follow_a_path(self, trajectory):
-    self.pigeon.setYaw(0, robotmap.CAN_TIMEOUT_MS)
-    self.pigeon.setFusedHeading(0, robotmap.CAN_TIMEOUT_MS)
-
-    self.leftTalonSlave.setSelectedSensorPosition(0, 0, robotmap.CAN_TIMEOUT_MS)
-    self.leftTalonSlave.getSensorCollection().setQuadraturePosition(0, robotmap.CAN_TIMEOUT_MS)
-    if not self.simulation:
-      self.leftTalonMaster.clearMotionProfileTrajectories()
-      self.leftTalonMaster.clearMotionProfileHasUnderrun(0)
-    if self.USING_MOTION_ARC:
-      self.leftTalonMaster.set(ctre.ControlMode.MotionProfileArc, 0)
-    else:
-      self.leftTalonMaster.set(ctre.ControlMode.MotionProfile, 0)
-
-    self.rightTalonSlave.setSelectedSensorPosition(0, 0, robotmap.CAN_TIMEOUT_MS)
-    self.rightTalonSlave.getSensorCollection().setQuadraturePosition(0, robotmap.CAN_TIMEOUT_MS)
-    if not self.simulation:
-      self.rightTalonMaster.clearMotionProfileTrajectories()
-      self.rightTalonMaster.clearMotionProfileHasUnderrun(0)
-    if self.USING_MOTION_ARC:
-      self.rightTalonMaster.set(ctre.ControlMode.MotionProfileArc, 0)
-    else:
-      self.rightTalonMaster.set(ctre.ControlMode.MotionProfile, 0)
-
     modifier = pf.modifiers.TankModifier(trajectory).modify(2.1) #Wheelbase in feet
-
-    self.leftTrajectory = modifier.getLeftTrajectory()
-    self.rightTrajectory = modifier.getRightTrajectory()
-
-    for i in range(len(trajectory)):
-      leftSeg = self.leftTrajectory[i]
-      rightSeg = self.rightTrajectory[i]
+    self.follow_tank_path(modifier.getLeftTrajectory(), modifier.getRightTrajectory())
+
+  def follow_tank_path(self, leftSegments, rightSegments):
+    '''
+    Left and right wheel segments in feet, either pathfinder Segments or
+    the records PathGeneration/velocity_profile.py generates offline
+    '''
+    self.reset_motion_profile()
+    self.stream_motion_profile(self.tank_points(leftSegments, rightSegments))
+
+  def tank_points(self, leftSegments, rightSegments):
+    '''Pairs of left and right points, only converted as they are pushed'''
+    for i in range(len(leftSegments)):
+      leftSeg = leftSegments[i]
+      rightSeg = rightSegments[i]
 
       if self.USING_MOTION_ARC:
         lposition = self.inchesToUnits((leftSeg.position + rightSeg.position) * 12)
@@ -221,7 +245,7 @@ class DeepSpaceDrive():
       slot1 = 1
       timeDur = 0
       zeroPos = bool(i == 0)
-      isLastPoint = bool(i == len(trajectory) - 1)
+      isLastPoint = bool(i == len(leftSegments) - 1)
       lvelocity = self.inchesToUnits(leftSeg.velocity * 12) / 10
       rvelocity = self.inchesToUnits(rightSeg.velocity * 12) / 10
 
@@ -229,16 +253,72 @@ class DeepSpaceDrive():
       rarbitrary_feed_forward = 0
       aux_feed_forward = 0
 
-      self.leftTrajectory[i] = ctre.BTrajectoryPoint(lposition, lvelocity, larbitrary_feed_forward, aux_position, aux_velocity, aux_feed_forward, slot0, slot1, isLastPoint, zeroPos, timeDur, self.USING_MOTION_ARC)
-      self.rightTrajectory[i] = ctre.BTrajectoryPoint(rposition, rvelocity, rarbitrary_feed_forward, aux_position, aux_velocity, aux_feed_forward, slot0, slot1, isLastPoint, zeroPos, timeDur, self.USING_MOTION_ARC)
+      yield (ctre.BTrajectoryPoint(lposition, lvelocity, larbitrary_feed_forward, aux_position, aux_velocity, aux_feed_forward, slot0, slot1, isLastPoint, zeroPos, timeDur, self.USING_MOTION_ARC),
+             ctre.BTrajectoryPoint(rposition, rvelocity, rarbitrary_feed_forward, aux_position, aux_velocity, aux_feed_forward, slot0, slot1, isLastPoint, zeroPos, timeDur, self.USING_MOTION_ARC))
+
+  def follow_compiled_path(self, trajectory):
+    '''
+    A trajectoryfile.TrajectoryFile, already in Talon units, so the points
+    are made straight from its columns.  It has to stay open until the
+    path is finished, the points are read from it as they are pushed
+    '''
+    self.reset_motion_profile()
+    self.stream_motion_profile(self.compiled_points(trajectory))
+
+  def compiled_points(self, trajectory):
+    slot0 = 0
+    slot1 = 1
+    last = trajectoryfile.FLAG_LAST_POINT
+    zero = trajectoryfile.FLAG_ZERO_POSITION
+    arc = self.USING_MOTION_ARC
+
+    columns = zip(trajectory.left_position, trajectory.left_velocity, trajectory.right_position,
+                  trajectory.right_velocity, trajectory.heading, trajectory.flags)
+    for lposition, lvelocity, rposition, rvelocity, heading, flag in columns:
+      if arc:
+        '''Both sides follow the sum of the distances and the aux loop holds the heading'''
+        lposition = rposition = lposition + rposition
+      else:
+        heading = 0
+      isLastPoint = bool(flag & last)
+      zeroPos = bool(flag & zero)
+      yield (ctre.BTrajectoryPoint(lposition, lvelocity, 0, heading, 0, 0, slot0, slot1, isLastPoint, zeroPos, 0, arc),
+             ctre.BTrajectoryPoint(rposition, rvelocity, 0, heading, 0, 0, slot0, slot1, isLastPoint, zeroPos, 0, arc))
 
-    for point in self.leftTrajectory:
-      if not self.simulation:
-        self.leftTalonMaster.pushMotionProfileTrajectory(point)
+  def reset_motion_profile(self):
+    self.stop_feeder()
 
-    for point in self.rightTrajectory:
-      if not self.simulation:
-        self.rightTalonMaster.pushMotionProfileTrajectory(point)
+    self.pigeon.setYaw(0, robotmap.CAN_TIMEOUT_MS)
+    self.pigeon.setFusedHeading(0, robotmap.CAN_TIMEOUT_MS)
+
+    self.leftTalonSlave.setSelectedSensorPosition(0, 0, robotmap.CAN_TIMEOUT_MS)
+    self.leftTalonSlave.getSensorCollection().setQuadraturePosition(0, robotmap.CAN_TIMEOUT_MS)
+    if not self.simulation:
+      self.leftTalonMaster.clearMotionProfileTrajectories()
+      self.leftTalonMaster.clearMotionProfileHasUnderrun(0)
+    if self.USING_MOTION_ARC:
+      self.leftTalonMaster.set(ctre.ControlMode.MotionProfileArc, 0)
+    else:
+      self.leftTalonMaster.set(ctre.ControlMode.MotionProfile, 0)
+
+    self.rightTalonSlave.setSelectedSensorPosition(0, 0, robotmap.CAN_TIMEOUT_MS)
+    self.rightTalonSlave.getSensorCollection().setQuadraturePosition(0, robotmap.CAN_TIMEOUT_MS)
+    if not self.simulation:
+      self.rightTalonMaster.clearMotionProfileTrajectories()
+      self.rightTalonMaster.clearMotionProfileHasUnderrun(0)
+    if self.USING_MOTION_ARC:
+      self.rightTalonMaster.set(ctre.ControlMode.MotionProfileArc, 0)
+    else:
+      self.rightTalonMaster.set(ctre.ControlMode.MotionProfile, 0)
+
+  def stream_motion_profile(self, points):
+    '''
+    points is an iterator of (left, right) BTrajectoryPoints.  Nothing is
+    converted or pushed here, the feeder thread does it a chunk at a time,
+    so starting a path takes the same time however long it is
+    '''
+    self.mp_points = iter(points)
+    self.mp_points_pushed = 0
 
     self.leftDone = False
     self.rightDone = False
@@ -248,47 +328,89 @@ class DeepSpaceDrive():
     self.executionFinishTime = 0
 
     self.current_state = DriveState.FOLLOW_PATH
+    if not self.simulation:
+      self.start_feeder()
+
+  def start_feeder(self):
+    self.mp_ready.clear()
+    self.leftMPStatus = None
+    self.rightMPStatus = None
+    self.bufferProcessingStartTime = self.timer.getFPGATimestamp()
+    self.feeder_running = True
+    self.feeder.startPeriodic(robotmap.BASE_TRAJECTORY_PERIOD_MS / 2000)
+
+  def push_points(self, leftStatus, rightStatus):
+    '''
+    Pushes the next points into the top buffers until MP_LEAD_POINTS are
+    waiting to run (everything in the top and bottom buffers) or
+    MP_PUSH_BUDGET is used up.  Returns how many were pushed
+    '''
+    if self.mp_points is None:
+      return 0
+
+    lead = max(leftStatus.topBufferCnt + leftStatus.btmBufferCnt, rightStatus.topBufferCnt + rightStatus.btmBufferCnt)
+    deadline = time.perf_counter() + self.MP_PUSH_BUDGET
+    pushed = 0
+    while lead + pushed < self.MP_LEAD_POINTS and time.perf_counter() < deadline:
+      try:
+        leftPoint, rightPoint = next(self.mp_points)
+      except StopIteration:
+        self.mp_points = None
+        break
+      self.leftTalonMaster.pushMotionProfileTrajectory(leftPoint)
+      self.rightTalonMaster.pushMotionProfileTrajectory(rightPoint)
+      pushed += 1
+
+    self.mp_points_pushed += pushed
+    return pushed
+
+  def stop_feeder(self):
+    if self.feeder_running:
+      self.feeder.stop()
+      self.feeder_running = False
+    self.mp_points = None
+
+  def feed_motion_profile(self):
+    '''
+    Runs on the Notifier thread.  The status objects are replaced whole,
+    so the main loop always reads a complete one
+    '''
+    leftStatus = self.leftTalonMaster.getMotionProfileStatus()
+    rightStatus = self.rightTalonMaster.getMotionProfileStatus()
+
+    pushed = self.push_points(leftStatus, rightStatus)
+
+    if (leftStatus.topBufferCnt > 0 or pushed) and leftStatus.btmBufferCnt < self.MP_BOTTOM_BUFFER_TARGET:
+      self.leftTalonMaster.processMotionProfileBuffer()
+    if (rightStatus.topBufferCnt > 0 or pushed) and rightStatus.btmBufferCnt < self.MP_BOTTOM_BUFFER_TARGET:
+      self.rightTalonMaster.processMotionProfileBuffer()
+
+    self.leftMPStatus = leftStatus
+    self.rightMPStatus = rightStatus
+
+    if not self.mp_ready.is_set():
+      full = leftStatus.btmBufferCnt > self.MP_START_THRESHOLD and rightStatus.btmBufferCnt > self.MP_START_THRESHOLD
+      '''Paths shorter than the threshold start once all of it is in'''
+      short = self.mp_points is None and leftStatus.topBufferCnt == 0 and rightStatus.topBufferCnt == 0 and \
+        leftStatus.btmBufferCnt > 0 and rightStatus.btmBufferCnt > 0
+      if full or short:
+        self.mp_ready.set()
 
   def process_auto_path(self):
     if self.simulation:
       self.leftDone = True
       self.rightDone = True
     else:
-      self.leftMPStatus = self.leftTalonMaster.getMotionProfileStatus()
-      self.rightMPStatus = self.rightTalonMaster.getMotionProfileStatus()
-
       '''
-      The processMotionProfileBuffer() moves trajectory points from the
-      "Top" level buffer into the "Bottom" level buffer.  This just means
-      they are moved from a buffer inside the roboRIO into a buffer inside
-      the Talon firmware itself.  The more sophisticated method is to call
-      this function on a seperate background thread which is running at a rate which
-      is twice as fast as the duration of the trajectory points.  Then in the main thread
-      check that the bottom buffer count is high enough to trigger the motion
-      profile execution to begin.  That allows the motion profile execution to
-      begin sooner.  For this test we can just wait until the top buffer has
-      been completely (mostly) emptied into the bottom buffer.
+      The feeder thread keeps the bottom buffers topped up and sets
+      mp_ready once both have MP_START_THRESHOLD points, so execution
+      starts on the first loop after that.  The statuses are the ones the
+      feeder last read, nothing else goes out on the CAN bus here.
       '''
+      if self.leftMPStatus is None or self.rightMPStatus is None:
+        return
 
-      '''Let's time this to see if it's really worth doing it the more sophisticated way'''
-      if not self.motionProfileEnabled and self.leftMPStatus.btmBufferCnt == 0 and self.rightMPStatus.btmBufferCnt == 0:
-        self.logger.info("Beginning to funnel trajectory points into the Talons")
-        self.bufferProcessingStartTime = self.timer.getFPGATimestamp()
-
-      '''
-      Don't print anything while funneling points into the Talons.
-      Printing will slow down execution and we want to measure time
-      that it took to do this operation.
-      '''
-      if self.leftMPStatus.topBufferCnt > 0 and self.leftMPStatus.btmBufferCnt < 50:
-        self.leftTalonMaster.processMotionProfileBuffer()
-
-      if self.rightMPStatus.topBufferCnt > 0 and self.rightMPStatus.btmBufferCnt < 50:
-        self.rightTalonMaster.processMotionProfileBuffer()
-
-      if not self.motionProfileEnabled and \
-        self.leftMPStatus.btmBufferCnt > 20 and \
-        self.rightMPStatus.btmBufferCnt > 20:
+      if not self.motionProfileEnabled and self.mp_ready.is_set():
         if self.USING_MOTION_ARC:
           self.leftTalonMaster.set(ctre.ControlMode.MotionProfileArc, 1)
           self.rightTalonMaster.set(ctre.ControlMode.MotionProfileArc, 1)
@@ -297,7 +419,7 @@ class DeepSpaceDrive():
           self.rightTalonMaster.set(ctre.ControlMode.MotionProfile, 1)
         self.motionProfileEnabled = True
         self.executionStartTime = self.timer.getFPGATimestamp()
-        self.logger.info("Beginning motion profile execution")
+        self.logger.info("Beginning motion profile execution after %.3fs of buffering" % (self.executionStartTime - self.bufferProcessingStartTime))
 
       if self.leftMPStatus.isLast and self.leftMPStatus.outputEnable == ctre.SetValueMotionProfile.Enable and not self.leftDone:
         self.leftTalonMaster.neutralOutput()
@@ -312,9 +434,69 @@ class DeepSpaceDrive():
         self.logger.info("Right motion profile is finished executing")
 
     if self.leftDone and self.rightDone:
+      self.stop_feeder()
       self.executionFinishTime = self.timer.getFPGATimestamp()
       self.current_state = DriveState.OPERATOR_CONTROL
 
+  def follow_pure_pursuit(self, follower):
+    '''Drive a purepursuit.PurePursuit follower, the path starts where the robot is now'''
+    self.pigeon.setYaw(0, robotmap.CAN_TIMEOUT_MS)
+    self.pigeon.setFusedHeading(0, robotmap.CAN_TIMEOUT_MS)
+    self.leftTalonSlave.setSelectedSensorPosition(0, 0, robotmap.CAN_TIMEOUT_MS)
+    self.rightTalonSlave.setSelectedSensorPosition(0, 0, robotmap.CAN_TIMEOUT_MS)
+
+    self.odometry.reset()
+    self.follower = follower
+    self.follower.reset()
+    self.current_state = DriveState.PURE_PURSUIT
+
+  def process_pure_pursuit(self):
+    left = self.unitsToInches(self.leftTalonSlave.getSelectedSensorPosition(0)) / 12
+    right = self.unitsToInches(self.rightTalonSlave.getSelectedSensorPosition(0)) / 12
+    heading = math.radians(self.pigeon.getYawPitchRoll()[0])
+
+    x, y = self.odometry.update(left, right, heading)
+    left_velocity, right_velocity = self.follower.update(x, y, heading)
+
+    if self.follower.finished:
+      self.leftTalonMaster.set(ctre.ControlMode.PercentOutput, 0)
+      self.rightTalonMaster.set(ctre.ControlMode.PercentOutput, 0)
+      self.current_state = DriveState.OPERATOR_CONTROL
+      return
+
+    '''Feet per second to encoder units per 100ms'''
+    self.leftTalonMaster.set(ctre.ControlMode.Velocity, self.inchesToUnits(left_velocity * 12) / 10)
+    self.rightTalonMaster.set(ctre.ControlMode.Velocity, self.inchesToUnits(right_velocity * 12) / 10)
+
+  def heading_at(self, timestamp):
+    '''Yaw in degrees at an FPGA timestamp in the last second, interpolated between loops'''
+    if not self.heading_history:
+      return None
+
+    newer = None
+    for older in reversed(self.heading_history):
+      if older[0] <= timestamp:
+        if newer is None:
+          return older[1]
+        fraction = (timestamp - older[0]) / (newer[0] - older[0])
+        return older[1] + fraction * (newer[1] - older[1])
+      newer = older
+
+    return newer[1]
+
+  def vision_target_heading(self, target):
+    '''
+    Yaw to turn to so we face the target.  The target yaw is measured from
+    where the robot was pointing when the frame was captured, not from
+    where it is pointing now, so a turn in progress doesn't make us overshoot.
+    '''
+    timestamp, yaw, distance, skew = target
+    heading = self.heading_at(timestamp) if timestamp > 0 else None
+    if heading is None:
+      heading = self.pigeon.getYawPitchRoll()[0]
+    # Vision yaw is positive to the right, pigeon yaw is positive to the left
+    return heading - yaw
+
   def unitsToInches(self, units):
     return units * robotmap.WHEEL_CIRCUMFERENCE / robotmap.DRIVE_ENCODER_COUNTS_PER_REV
 
@@ -0,0 +1,154 @@
+import math
+
+class TankOdometry():
+  '''
+  Dead reckoning pose from the wheel distances and the gyro.  Distances in
+  feet, heading in radians with left turns positive.
+  '''
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self, x=0.0, y=0.0, left=0.0, right=0.0):
+    self.x = x
+    self.y = y
+    self.left = left
+    self.right = right
+
+  def update(self, left, right, heading):
+    distance = ((left - self.left) + (right - self.right)) / 2
+    self.left = left
+    self.right = right
+    self.x += distance * math.cos(heading)
+    self.y += distance * math.sin(heading)
+    return self.x, self.y
+
+class PurePursuit():
+  '''
+  Follows a smoothed path from PathGeneration by steering towards the point
+  `lookahead` feet further along it.  points is a list of (x, y) in feet and
+  velocities the target speed at every point (the velocity_profile output).
+
+  Both the closest point and the lookahead point only ever move forwards
+  along the path, and are only searched for a couple of lookahead
+  distances along the path from the closest point.  update() does a
+  bounded amount of work no matter how long the path is.
+  '''
+
+  def __init__(self, points, velocities, lookahead, wheelbase, max_acceleration=None, period=0.02,
+               tolerance=0.1, min_velocity=0.25):
+    self.points = [(float(x), float(y)) for x, y in points]
+    self.velocities = [float(v) for v in velocities]
+    self.lookahead = lookahead
+    self.wheelbase = wheelbase
+    self.max_acceleration = max_acceleration
+    self.period = period
+
+    # Distance along the path to every point, bounds the searches
+    self.distances = [0.0]
+    for (x0, y0), (x1, y1) in zip(self.points, self.points[1:]):
+      self.distances.append(self.distances[-1] + math.hypot(x1 - x0, y1 - y0))
+
+    self.tolerance = tolerance
+    # The profile starts and ends at 0, keep creeping until the end is reached
+    self.min_velocity = min_velocity
+    self.reset()
+
+  def reset(self):
+    self.closest = 0
+    # Lookahead point as segment index plus fraction along it
+    self.lookahead_index = 0.0
+    self.lookahead_point = self.points[0]
+    self.velocity = 0.0
+    self.curvature = 0.0
+    self.finished = len(self.points) < 2
+
+  def find_closest(self, x, y):
+    best = self.closest
+    best_distance = self.distance_squared(best, x, y)
+    # The robot can't have gone further than the lookahead in one loop
+    limit = self.distances[self.closest] + self.lookahead
+    i = self.closest + 1
+    while i < len(self.points) and self.distances[i] <= limit:
+      distance = self.distance_squared(i, x, y)
+      if distance < best_distance:
+        best, best_distance = i, distance
+      i += 1
+    self.closest = best
+    return best
+
+  def distance_squared(self, i, x, y):
+    px, py = self.points[i]
+    return (px - x) ** 2 + (py - y) ** 2
+
+  def find_lookahead(self, x, y):
+    '''First point on the path, past the last one, exactly lookahead away'''
+    # Past this distance along the path the circle could only be crossed
+    # by the path coming back on itself
+    limit = self.distances[self.closest] + 2 * self.lookahead + math.sqrt(self.distance_squared(self.closest, x, y))
+    i = int(self.lookahead_index)
+    while i < len(self.points) - 1 and self.distances[i] <= limit:
+      t = self.intersect(i, x, y)
+      if t is not None and i + t > self.lookahead_index:
+        self.lookahead_index = i + t
+        (sx, sy), (ex, ey) = self.points[i], self.points[i + 1]
+        self.lookahead_point = (sx + t * (ex - sx), sy + t * (ey - sy))
+        return self.lookahead_point
+      i += 1
+
+    # Near the end the circle runs off the path, aim for the last point
+    if self.distance_squared(len(self.points) - 1, x, y) < self.lookahead ** 2:
+      self.lookahead_index = len(self.points) - 1.0
+      self.lookahead_point = self.points[-1]
+    return self.lookahead_point
+
+  def intersect(self, i, x, y):
+    '''Fraction along segment i where it leaves the lookahead circle, or None'''
+    (sx, sy), (ex, ey) = self.points[i], self.points[i + 1]
+    dx, dy = ex - sx, ey - sy
+    fx, fy = sx - x, sy - y
+    a = dx * dx + dy * dy
+    if a == 0:
+      return None
+    b = 2 * (fx * dx + fy * dy)
+    c = fx * fx + fy * fy - self.lookahead ** 2
+    discriminant = b * b - 4 * a * c
+    if discriminant < 0:
+      return None
+    root = math.sqrt(discriminant)
+    # Prefer the far intersection, it is the one ahead of the robot
+    for t in ((-b + root) / (2 * a), (-b - root) / (2 * a)):
+      if 0 <= t <= 1:
+        return t
+    return None
+
+  def update(self, x, y, heading):
+    '''Returns (left, right) wheel velocity targets for the pose, in feet per second'''
+    if self.finished:
+      return 0.0, 0.0
+
+    closest = self.find_closest(x, y)
+    last = len(self.points) - 1
+    if closest == last or self.distance_squared(last, x, y) < self.tolerance ** 2:
+      self.finished = True
+      self.velocity = 0.0
+      return 0.0, 0.0
+
+    lx, ly = self.find_lookahead(x, y)
+
+    # Curvature of the arc through the robot and the lookahead point,
+    # tangent to the way the robot is facing
+    dx, dy = lx - x, ly - y
+    side = -math.sin(heading) * dx + math.cos(heading) * dy
+    distance_squared = dx * dx + dy * dy
+    self.curvature = 2 * side / distance_squared if distance_squared > 0 else 0.0
+
+    # Speed for where the robot is heading, not where it just was
+    target = max(self.min_velocity, self.velocities[closest + 1])
+    if self.max_acceleration is not None:
+      step = self.max_acceleration * self.period
+      target = max(self.velocity - step, min(self.velocity + step, target))
+    self.velocity = target
+
+    turn = self.curvature * self.wheelbase / 2
+    return target * (1 - turn), target * (1 + turn)
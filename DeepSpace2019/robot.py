@@ -12,6 +12,7 @@ from drive import DeepSpaceDrive
 from lift import DeepSpaceLift
 from claw import DeepSpaceClaw
 from harpoon import DeepSpaceHarpoon
+from vision import DeepSpaceVision
 
 from auto1 import Auto1
 from auto2 import Auto2
@@ -61,6 +62,9 @@ class MyRobot(wpilib.TimedRobot):
     self.harpoon = DeepSpaceHarpoon(self.logger)
     self.harpoon.init()
 
+    self.vision = DeepSpaceVision(self.logger)
+    self.vision.init()
+
 
   def autonomousInit(self):
     self.compressor.setClosedLoopControl(True)
@@ -113,6 +117,7 @@ class MyRobot(wpilib.TimedRobot):
     self.lift.iterate(self.robot_mode, self.isSimulation(), self.pilot_stick, self.copilot_stick)
     self.claw.iterate(self.robot_mode, self.pilot_stick, self.copilot_stick)
     self.harpoon.iterate(self.robot_mode, self.pilot_stick, self.copilot_stick)
+    self.vision.set_drive_direction(self.drive.drive_direction)
 
     if self.lift.current_lift_preset != LiftPreset.LIFT_PRESET_STOW and self.lift.on_target:
       self.pilot_stick.pulseRumble(1.0)
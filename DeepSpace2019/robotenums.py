@@ -9,6 +9,7 @@ class RobotMode(Enum):
 class DriveState(Enum):
   FOLLOW_PATH = 1
   OPERATOR_CONTROL = 2
+  PURE_PURSUIT = 3
 
 class HarpoonState(Enum):
   HARPOON_STOW_RETRACT_CENTER = 1
@@ -64,6 +65,10 @@ class RightLeft(Enum):
   RIGHT = 1
   LEFT = 2
 
+class NearFar(Enum):
+  NEAR = 1
+  FAR = 2
+
 class HabLevel(Enum):
   LEVEL1 = 1
   LEVEL2 = 2
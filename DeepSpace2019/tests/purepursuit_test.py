@@ -0,0 +1,116 @@
+'''
+Drives purepursuit.PurePursuit and TankOdometry through pyfrc's TankModel,
+the same drivetrain model physics.py uses, with a simple velocity loop
+standing in for the Talons.  Skipped when pyfrc isn't installed.
+'''
+import math
+
+import pytest
+
+tankmodel = pytest.importorskip('pyfrc.physics.tankmodel')
+from pyfrc.physics import motor_cfgs
+from pyfrc.physics.units import units
+
+from purepursuit import PurePursuit, TankOdometry
+
+PERIOD = 0.02
+WHEELBASE = 22 / 12
+LOOKAHEAD = 1.5
+
+MAX_VELOCITY = 6.0
+MAX_ACCELERATION = 6.0
+
+'''Talon velocity loop, feed forward from the model's top speed plus a little P'''
+KP = 0.1
+
+def make_drivetrain():
+  '''Same drivetrain as physics.py'''
+  bumper_width = 3.25 * units.inch
+  return tankmodel.TankModel.theory(
+    motor_cfgs.MOTOR_CFG_CIM,
+    110 * units.lbs,
+    10.71,
+    2,
+    22 * units.inch,
+    23 * units.inch + bumper_width * 2,
+    32 * units.inch + bumper_width * 2,
+    6 * units.inch,
+  )
+
+def top_speed():
+  drivetrain = make_drivetrain()
+  for _ in range(300):
+    drivetrain.get_distance(-1, 1, PERIOD)
+  return drivetrain.r_velocity
+
+def make_path(spacing=0.25):
+  '''6 ft straight, a 90 degree left turn of radius 6 ft, then 4 ft straight'''
+  points = [(i * spacing, 0.0) for i in range(int(6 / spacing))]
+  radius = 6.0
+  steps = int(radius * math.pi / 2 / spacing)
+  for i in range(steps):
+    angle = i / steps * math.pi / 2
+    points.append((6 + radius * math.sin(angle), radius - radius * math.cos(angle)))
+  points += [(12.0, 6 + i * spacing) for i in range(int(4 / spacing) + 1)]
+
+  '''Trapezoidal profile from both ends, like velocity_profile gives'''
+  distances = [0.0]
+  for (x0, y0), (x1, y1) in zip(points, points[1:]):
+    distances.append(distances[-1] + math.hypot(x1 - x0, y1 - y0))
+  velocities = [min(MAX_VELOCITY, math.sqrt(2 * MAX_ACCELERATION * d), math.sqrt(2 * MAX_ACCELERATION * (distances[-1] - d)))
+                for d in distances]
+  return points, velocities
+
+def cross_track_error(points, x, y):
+  '''Distance from (x, y) to the nearest segment of the path'''
+  best = float('inf')
+  for (sx, sy), (ex, ey) in zip(points, points[1:]):
+    dx, dy = ex - sx, ey - sy
+    t = max(0.0, min(1.0, ((x - sx) * dx + (y - sy) * dy) / (dx * dx + dy * dy)))
+    best = min(best, math.hypot(sx + t * dx - x, sy + t * dy - y))
+  return best
+
+def follow(points, velocities, timeout=15.0):
+  '''Runs the follower against the model, returns the (x, y) of every loop and whether it finished'''
+  drivetrain = make_drivetrain()
+  kf = 1 / top_speed()
+  follower = PurePursuit(points, velocities, LOOKAHEAD, WHEELBASE, max_acceleration=MAX_ACCELERATION, period=PERIOD)
+  odometry = TankOdometry()
+
+  '''The true pose, from what the model says the robot did.  heading doubles as the gyro'''
+  x = y = heading = 0.0
+  left = right = 0.0
+  poses = []
+  for _ in range(int(timeout / PERIOD)):
+    odometry.update(drivetrain.l_position, drivetrain.r_position, heading)
+    left, right = follower.update(odometry.x, odometry.y, heading)
+    if follower.finished:
+      return poses, True
+
+    left_output = max(-1.0, min(1.0, kf * left + KP * (left - drivetrain.l_velocity)))
+    right_output = max(-1.0, min(1.0, kf * right + KP * (right - drivetrain.r_velocity)))
+
+    '''TankModel wants the left side inverted and turns clockwise for a positive angle'''
+    dx, dy, turn = drivetrain.get_distance(-left_output, right_output, PERIOD)
+    x += dx * math.cos(heading) + dy * math.sin(heading)
+    y += dx * math.sin(heading) - dy * math.cos(heading)
+    heading -= turn
+    poses.append((x, y))
+
+  return poses, False
+
+def test_follows_curve():
+  points, velocities = make_path()
+  poses, finished = follow(points, velocities)
+
+  assert finished
+  assert max(cross_track_error(points, x, y) for x, y in poses) < 0.25
+
+def test_finishes_at_end():
+  points, velocities = make_path()
+  poses, finished = follow(points, velocities)
+
+  assert finished
+  end_x, end_y = points[-1]
+  x, y = poses[-1]
+  assert math.hypot(end_x - x, end_y - y) < 0.3
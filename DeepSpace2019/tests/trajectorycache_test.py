@@ -0,0 +1,60 @@
+'''
+The cache against trajectory files written straight to its directory, so
+pathfinder is never needed.
+'''
+import trajectorycache
+import trajectoryfile
+
+UNITS_PER_FOOT = 1000.0
+
+def route(n):
+  return [(0, 0, 0), (n + 1, 2, 0)]
+
+def write_route(cache, waypoints, count=50):
+  '''A route and its mirror share the file under the smaller key'''
+  key = min(trajectorycache.trajectory_key(waypoints, cache.constraints, UNITS_PER_FOOT),
+            trajectorycache.trajectory_key(trajectorycache.mirror_waypoints(waypoints), cache.constraints, UNITS_PER_FOOT))
+  columns = {name: [float(i * (c + 1)) for i in range(count)] for c, name in enumerate(trajectoryfile.COLUMNS)}
+  trajectoryfile.write_trajectory(cache.path(key), columns, 0.02, UNITS_PER_FOOT)
+
+def make_cache(tmpdir, routes, capacity=2):
+  cache = trajectorycache.TrajectoryCache(str(tmpdir), UNITS_PER_FOOT, capacity=capacity)
+  for waypoints in routes:
+    write_route(cache, waypoints)
+  return cache
+
+def test_evicted_while_streaming(tmpdir):
+  '''Like drive.compiled_points, the columns are read while other routes push the entry out'''
+  routes = [route(n) for n in range(4)]
+  cache = make_cache(tmpdir, routes)
+  trajectory = cache.get(routes[0])
+  columns = zip(trajectory.left_position, trajectory.right_velocity, trajectory.heading, trajectory.flags)
+  first = [next(columns) for _ in range(10)]
+
+  for waypoints in routes[1:]:
+    cache.get(waypoints)
+  assert trajectory not in cache.entries.values()
+
+  points = first + list(columns)
+  assert len(points) == 50
+  assert points[-1] == (49.0, 196.0, 245.0, trajectoryfile.FLAG_LAST_POINT)
+
+def test_evicted_mirror_stays_open(tmpdir):
+  routes = [route(n) for n in range(4)]
+  cache = make_cache(tmpdir, routes)
+  mirrored = cache.get(trajectorycache.mirror_waypoints(routes[0]))
+  if not isinstance(mirrored, trajectoryfile.MirroredTrajectory):
+    mirrored = trajectoryfile.mirror(mirrored)
+
+  for waypoints in routes[1:]:
+    cache.get(waypoints)
+  assert list(mirrored.heading)[-1] == -245.0
+
+def test_lookup_after_eviction_reloads(tmpdir):
+  routes = [route(n) for n in range(3)]
+  cache = make_cache(tmpdir, routes)
+  for waypoints in routes + routes[:1]:
+    cache.get(waypoints)
+  assert cache.loads == 4
+  assert cache.generated == 0
+  assert len(cache.entries) == 2
@@ -0,0 +1,169 @@
+'''
+Compiled trajectories looked up by what they were generated from.
+
+The key is a hash of the waypoints and everything else that changes the
+result (fit, sample count, dt, max velocity/acceleration/jerk, wheelbase
+and the Talon units), so a trajectory is only ever generated once.  Entries
+are trajectoryfile files named <key>.bin in the cache directory.  They can be
+built offline and deployed with the robot code:
+
+  python3 trajectorycache.py /home/lvuser/trajectories
+
+or are generated with pathfinder and saved the first time they are asked
+for.  The last few used stay open in memory, least recently used go first.
+
+A route and its mirror image across the x axis (the Left and Right versions
+of the same auto) share one entry, stored under the smaller of their two
+keys.  The other one is trajectoryfile.mirror() of it.
+'''
+import collections
+import hashlib
+import os
+import struct
+import weakref
+
+import trajectoryfile
+
+Constraints = collections.namedtuple('Constraints', ['fit', 'samples', 'dt', 'max_velocity', 'max_acceleration', 'max_jerk', 'wheelbase'])
+
+'''fit is the name of a pathfinder FIT_ constant, samples is pf.SAMPLES_HIGH, so keys work without pathfinder'''
+DEFAULT_CONSTRAINTS = Constraints('HERMITE_CUBIC', 100000, 0.02, 4.0, 4.0, 120.0, 2.1)
+
+KEY_VERSION = 1
+
+def waypoint_tuple(waypoint):
+  if hasattr(waypoint, 'angle'):
+    return (waypoint.x, waypoint.y, waypoint.angle)
+  return tuple(waypoint)[:3]
+
+def mirror_waypoints(waypoints):
+  return [(x, -y, -angle) for x, y, angle in map(waypoint_tuple, waypoints)]
+
+def trajectory_key(waypoints, constraints, units_per_foot):
+  '''Hex digest of everything the compiled trajectory depends on, doubles are hashed exactly'''
+  digest = hashlib.sha1()
+  digest.update(struct.pack('<HI', KEY_VERSION, len(waypoints)))
+  for waypoint in waypoints:
+    digest.update(struct.pack('<3d', *waypoint_tuple(waypoint)))
+  digest.update(constraints.fit.encode('ascii'))
+  digest.update(struct.pack('<i', constraints.samples))
+  digest.update(struct.pack('<6d', constraints.dt, constraints.max_velocity, constraints.max_acceleration,
+                            constraints.max_jerk, constraints.wheelbase, units_per_foot))
+  return digest.hexdigest()
+
+def generate(waypoints, constraints, units_per_foot, path):
+  '''Runs pathfinder and the TankModifier and writes the compiled result to path'''
+  import pathfinder as pf
+
+  points = [pf.Waypoint(*waypoint_tuple(waypoint)) for waypoint in waypoints]
+  info, trajectory = pf.generate(points, getattr(pf, 'FIT_' + constraints.fit), constraints.samples,
+                                 dt=constraints.dt,
+                                 max_velocity=constraints.max_velocity,
+                                 max_acceleration=constraints.max_acceleration,
+                                 max_jerk=constraints.max_jerk)
+  modifier = pf.modifiers.TankModifier(trajectory).modify(constraints.wheelbase)
+  columns = trajectoryfile.compile_tank(modifier.getLeftTrajectory(), modifier.getRightTrajectory(), units_per_foot)
+  trajectoryfile.write_trajectory(path, columns, constraints.dt, units_per_foot)
+
+class TrajectoryCache():
+  def __init__(self, directory, units_per_foot, constraints=DEFAULT_CONSTRAINTS, capacity=8, logger=None):
+    self.directory = directory
+    self.units_per_foot = units_per_foot
+    self.constraints = constraints
+    self.capacity = capacity
+    self.logger = logger
+    self.entries = collections.OrderedDict()
+    '''The mirror view handed out for each entry, weakly so it goes when nobody follows it'''
+    self.mirrors = {}
+
+    self.hits = 0
+    self.loads = 0
+    self.generated = 0
+
+  def path(self, key):
+    return os.path.join(self.directory, key + '.bin')
+
+  def get(self, waypoints, constraints=None):
+    '''
+    The TrajectoryFile for the waypoints, from memory, then disk, then
+    pathfinder.  Evicting an entry only drops the cache's reference, the
+    drive may still be streaming points from it.  The file is unmapped
+    when the last reference to it (or to one of its columns) goes
+    '''
+    constraints = constraints or self.constraints
+    key = trajectory_key(waypoints, constraints, self.units_per_foot)
+    mirrored_key = trajectory_key(mirror_waypoints(waypoints), constraints, self.units_per_foot)
+    if mirrored_key < key:
+      return self.mirror(mirrored_key, self.get_key(mirrored_key, mirror_waypoints(waypoints), constraints))
+    return self.get_key(key, waypoints, constraints)
+
+  def mirror(self, key, entry):
+    ref = self.mirrors.get(key)
+    view = ref() if ref is not None else None
+    if view is None:
+      view = trajectoryfile.mirror(entry)
+      self.mirrors[key] = weakref.ref(view)
+    return view
+
+  def get_key(self, key, waypoints, constraints):
+    entry = self.entries.get(key)
+    if entry is not None:
+      self.entries.move_to_end(key)
+      self.hits += 1
+      return entry
+
+    path = self.path(key)
+    entry = None
+    if os.path.exists(path):
+      try:
+        entry = trajectoryfile.TrajectoryFile(path, self.units_per_foot)
+        self.loads += 1
+      except trajectoryfile.TrajectoryFormatError as e:
+        self.log('Regenerating %s: %s' % (key, e))
+
+    if entry is None:
+      os.makedirs(self.directory, exist_ok=True)
+      generate(waypoints, constraints, self.units_per_foot, path)
+      entry = trajectoryfile.TrajectoryFile(path, self.units_per_foot)
+      self.generated += 1
+      self.log('Generated trajectory %s' % key)
+
+    '''The map has its own descriptor, only the file object is left to close once the entry is unreferenced'''
+    weakref.finalize(entry, entry.fp.close)
+    self.entries[key] = entry
+    while len(self.entries) > self.capacity:
+      self.evict(*self.entries.popitem(last=False))
+    return entry
+
+  def evict(self, key, entry):
+    '''Not closed here, whoever still holds the entry or a mirror view of it keeps it open'''
+    self.mirrors.pop(key, None)
+
+  def preload(self, routes):
+    '''Loads (or generates) every list of waypoints in routes, so choosing one later is a lookup'''
+    for waypoints in routes:
+      self.get(waypoints)
+
+  def log(self, message):
+    if self.logger is not None:
+      self.logger.info('<TrajectoryCache> ' + message)
+
+def routes():
+  '''Every waypoint list in AutoTrajectories by name'''
+  from trajectories import AutoTrajectories
+  return {name: value for name, value in vars(AutoTrajectories).items() if isinstance(value, list)}
+
+if __name__ == '__main__':
+  import argparse
+  import robotmap
+
+  parser = argparse.ArgumentParser(description='Build the trajectory cache for every AutoTrajectories route')
+  parser.add_argument('directory')
+  args = parser.parse_args()
+
+  cache = TrajectoryCache(args.directory, trajectoryfile.units_per_foot(robotmap.DRIVE_ENCODER_COUNTS_PER_REV, robotmap.WHEEL_DIAMETER))
+  for name, waypoints in sorted(routes().items()):
+    entry = cache.get(waypoints)
+    kind = 'mirrored' if isinstance(entry, trajectoryfile.MirroredTrajectory) else 'stored'
+    print('%s: %d points, %s' % (name, len(entry), kind))
+  print('%d files, %d generated' % (len(cache.entries), cache.generated))
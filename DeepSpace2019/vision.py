@@ -0,0 +1,60 @@
+import wpilib
+from wpilib import SmartDashboard
+from networktables import NetworkTables
+
+class DeepSpaceVision():
+  '''
+  Robot side of the vision coprocessor link.  The coprocessor pings us
+  over NetworkTables to work out the offset between its clock and the
+  FPGA clock, so the targets it publishes are stamped in FPGA time.
+  '''
+
+  # Layout of the "target" number array published by the coprocessor
+  TARGET_TIMESTAMP = 0
+  TARGET_VALID = 1
+  TARGET_YAW = 2
+  TARGET_DISTANCE = 3
+  TARGET_SKEW = 4
+  TARGET_SOLVER_MS = 5
+
+  def __init__(self, logger):
+    self.logger = logger
+    self.drive_direction = None
+
+  def init(self):
+    self.logger.info("DeepSpaceVision::init()")
+    self.table = NetworkTables.getTable("team63_vision_table")
+    self.table.addEntryListener(self.answer_ping, key="clock_ping")
+
+  def answer_ping(self, table, key, value, isNew):
+    '''Runs on the NetworkTables thread, answer as fast as possible'''
+    if len(value) < 2:
+      return
+    table.putNumberArray("clock_pong", (value[0], value[1], wpilib.Timer.getFPGATimestamp()))
+    NetworkTables.flush()
+
+  def set_drive_direction(self, direction):
+    '''The coprocessor favours the camera facing this way, 1 forward and -1 backward'''
+    if direction != self.drive_direction:
+      self.drive_direction = direction
+      self.table.putNumber("drive_direction", direction)
+
+  def get_target(self, camera=None):
+    '''
+    Returns the latest target as (timestamp, yaw, distance, skew), or None
+    if there is no valid target.  The timestamp is the FPGA time the frame
+    was captured, 0 if the coprocessor clock is not synchronized yet.
+    The first target camera publishes on the vision table itself, pass the
+    camera name to read any other.
+    '''
+    table = self.table if camera is None else self.table.getSubTable(camera)
+    target = table.getNumberArray("target", [])
+    if len(target) <= self.TARGET_SKEW or not target[self.TARGET_VALID]:
+      return None
+
+    '''Unsynchronized, the latency would be the whole robot uptime'''
+    if target[self.TARGET_TIMESTAMP] == 0:
+      SmartDashboard.putNumber("Vision Latency", -1)
+    else:
+      SmartDashboard.putNumber("Vision Latency", wpilib.Timer.getFPGATimestamp() - target[self.TARGET_TIMESTAMP])
+    return (target[self.TARGET_TIMESTAMP], target[self.TARGET_YAW], target[self.TARGET_DISTANCE], target[self.TARGET_SKEW])
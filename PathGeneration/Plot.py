@@ -1,17 +1,41 @@
 from tkinter import *
+import struct
+import zlib
+import numpy
 from Vector2D import Vector2D
 
 #Plots the points and draws lines for the path on a canvas
+#
+#Small paths get a canvas item per segment and per point like always.  Paths
+#longer than FAST_POINTS (or with fast=True) are drawn as one polyline each,
+#with the points thinned out to one per screen pixel, and the canvas can be
+#dragged to pan and scrolled to zoom.  values (the curvature or velocity at
+#every path point) colors the path points in an image drawn over the lines,
+#blue for the lowest value to red for the highest.  While dragging the
+#drawing is only moved, it is redrawn when the button is let go.
+
+FAST_POINTS = 1000
 
 class Plot(object):
-    def __init__(self, points, path, size):
+    def __init__(self, points, path, size, fast=None, values=None, width=900, height=900):
         self.points = points
         self.path = path
         self.size = size
 
         self.root = Tk()
-        self.c = Canvas(self.root, width=900, height=900)
+        self.c = Canvas(self.root, width=width, height=height)
+
+        if fast is None:
+            fast = len(self.path) > FAST_POINTS or values is not None
+        if fast:
+            self.drawFast(values, width, height)
+        else:
+            self.drawItems()
 
+        self.c.pack()
+        self.root.mainloop()
+
+    def drawItems(self):
         #Draw lines for the genereated path & the given coordinates
         for i in range(len(self.points) - 1):
             self.c.create_line(self.points[i].x, self.points[i].y, self.points[i + 1].x, self.points[i + 1].y, fill='red')
@@ -21,9 +45,132 @@ class Plot(object):
         for i in range(len(self.path)):
             self.c.create_oval(self.path[i].x - (self.size), self.path[i].y - (self.size), self.path[i].x + self.size, self.path[i].y + self.size, fill='grey')
 
-        self.c.pack()
-        self.root.mainloop()
-            
+    def drawFast(self, values, width, height):
+        self.pointArray = toPoints(self.points)
+        self.pathArray = toPoints(self.path)
+        self.values = None if values is None else numpy.asarray(values, dtype=numpy.float64)
+        self.width = width
+        self.height = height
+
+        #Screen position is world * scale + offset, the same as drawItems() to start with
+        self.scale = 1.0
+        self.offset = numpy.zeros(2)
+
+        #The items are made once and only have their coordinates changed after
+        self.pointLine = self.c.create_line(0, 0, 0, 0, fill='red')
+        self.pathLine = self.c.create_line(0, 0, 0, 0, width=2)
+        self.overlay = None
+        self.image = None
+        if self.values is not None:
+            self.overlay = self.c.create_image(0, 0, anchor=NW)
+
+        self.c.bind("<ButtonPress-1>", self.startPan)
+        self.c.bind("<B1-Motion>", self.pan)
+        self.c.bind("<ButtonRelease-1>", self.endPan)
+        self.c.bind("<MouseWheel>", self.zoom)
+        #X11 sends the wheel as buttons 4 and 5
+        self.c.bind("<Button-4>", self.zoom)
+        self.c.bind("<Button-5>", self.zoom)
+
+        self.redraw()
+
+    def redraw(self):
+        self.setLine(self.pointLine, self.pointArray)
+        self.setLine(self.pathLine, self.pathArray)
+        if self.overlay is not None:
+            self.image = rasterize(self.toScreen(self.pathArray), self.values, self.size, self.width, self.height)
+            self.c.itemconfig(self.overlay, image=self.image)
+            self.c.coords(self.overlay, 0, 0)
+
+    def setLine(self, item, points):
+        screen = decimate(self.toScreen(points))
+        if len(screen) < 2:
+            screen = numpy.vstack((screen, screen))
+        self.c.coords(item, *screen.ravel().tolist())
+
+    def toScreen(self, points):
+        return points * self.scale + self.offset
+
+    def startPan(self, event):
+        self.panStart = numpy.array((event.x, event.y), dtype=numpy.float64)
+
+    #Moves what is already drawn, rasterizing the overlay on every mouse
+    #move is far too slow for big paths
+    def pan(self, event):
+        position = numpy.array((event.x, event.y), dtype=numpy.float64)
+        dx, dy = position - self.panStart
+        self.offset += (dx, dy)
+        self.panStart = position
+        for item in (self.pointLine, self.pathLine, self.overlay):
+            if item is not None:
+                self.c.move(item, dx, dy)
+
+    #The overlay only covers the canvas, draw the parts dragged into view
+    def endPan(self, event):
+        self.redraw()
+
+    #Zooms around the mouse, so the point under it stays put
+    def zoom(self, event):
+        factor = 1.25 if event.num == 4 or event.delta > 0 else 0.8
+        mouse = numpy.array((event.x, event.y), dtype=numpy.float64)
+        self.offset = mouse - (mouse - self.offset) * factor
+        self.scale *= factor
+        self.redraw()
+
+#List of Vector2D, VectorArray or array to an (N, 2) array
+def toPoints(points):
+    if len(points) and isinstance(points[0], Vector2D):
+        points = [(p.x, p.y) for p in points]
+    return numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+
+#Keeps the first point to land on every screen pixel along the line, plus
+#the last point.  Nothing drawn changes by more than a pixel
+def decimate(screen):
+    if len(screen) < 3:
+        return screen
+    pixels = numpy.floor(screen).astype(numpy.int64)
+    keep = numpy.ones(len(screen), dtype=bool)
+    keep[1:] = numpy.any(pixels[1:] != pixels[:-1], axis=1)
+    keep[-1] = True
+    return screen[keep]
+
+#Blue to red for values from 0 to 1
+def colorMap(normalized):
+    return numpy.column_stack((255 * normalized,
+                               255 * (1 - numpy.abs(2 * normalized - 1)),
+                               255 * (1 - normalized))).astype(numpy.uint8)
+
+#Draws every point as a colored square of radius size into a see-through
+#image the size of the canvas, one PhotoImage no matter how many points
+def rasterize(screen, values, size, width, height):
+    image = numpy.zeros((height, width, 4), dtype=numpy.uint8)
+
+    low, high = numpy.nanmin(values), numpy.nanmax(values)
+    normalized = (values - low) / (high - low) if high > low else numpy.zeros(len(values))
+    colors = colorMap(numpy.nan_to_num(normalized))
+
+    pixels = numpy.round(screen).astype(numpy.int64)
+    for dx in range(-size, size + 1):
+        for dy in range(-size, size + 1):
+            x = pixels[:, 0] + dx
+            y = pixels[:, 1] + dy
+            inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            image[y[inside], x[inside], :3] = colors[inside]
+            image[y[inside], x[inside], 3] = 255
+
+    return PhotoImage(data=toPNG(image), format="png")
 
+#Uncompressed RGBA image to PNG bytes, Tk 8.6 reads PNG itself
+def toPNG(image):
+    height, width = image.shape[:2]
+    #Every row starts with filter type 0
+    rows = numpy.zeros((height, width * 4 + 1), dtype=numpy.uint8)
+    rows[:, 1:] = image.reshape(height, width * 4)
 
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
 
+    return (b"\x89PNG\r\n\x1a\n" +
+            chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)) +
+            chunk(b"IDAT", zlib.compress(rows.tobytes(), 1)) +
+            chunk(b"IEND", b""))
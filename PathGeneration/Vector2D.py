@@ -2,10 +2,20 @@ import math
 
 class Vector2D(object):
     """Creates a 2D Vector"""
+    #No per-vector __dict__, paths are made of thousands of these
+    __slots__ = ("x", "y")
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
 
+    def __repr__(self):
+        return "Vector2D({}, {})".format(self.x, self.y)
+
+    #Lets a vector be unpacked, x, y = v
+    def __iter__(self):
+        yield self.x
+        yield self.y
 
     #Finds the magnitude of the vector
     def mag(self):
@@ -13,35 +23,23 @@ class Vector2D(object):
 
     #Add vectors
     def add(self, other):
-        m = Vector2D(0, 0)
-        m.x = self.x + other.x
-        m.y = self.y + other.y
-        return m
+        return Vector2D(self.x + other.x, self.y + other.y)
 
     #Subtract vectors
     def sub(self, other):
-        m = Vector2D(0, 0)
-        m.x = self.x - other.x
-        m.y = self.y - other.y
-        return m
+        return Vector2D(self.x - other.x, self.y - other.y)
 
     #Multiply vectors
     def mult(self, other):
-        m = Vector2D(0, 0)
-        m.x = self.x * other.x
-        m.y = self.y * other.y
-        return m
+        return Vector2D(self.x * other.x, self.y * other.y)
 
     #Divide vectors
     def div(self, other):
-        m = Vector2D(0, 0)
-        m.x = self.x / other.x
-        m.y = self.y / other.y
-        return m
+        return Vector2D(self.x / other.x, self.y / other.y)
 
     #Calculates dist between self and another vector
     def dist(self, other):
-        return math.sqrt(((other.x - self.x) ** 2) + ((other.y - self.x) ** 2))
+        return math.sqrt(((other.x - self.x) ** 2) + ((other.y - self.y) ** 2))
 
     #Calculates dot product of two vectors
     def dot(self, other):
@@ -52,10 +50,27 @@ class Vector2D(object):
         angle = math.atan2(-self.y, self.x)
         return -1 * angle
 
+    #Operators, * and / also take a plain number, v * 2
+    def __add__(self, other):
+        return Vector2D(self.x + other.x, self.y + other.y)
 
+    def __sub__(self, other):
+        return Vector2D(self.x - other.x, self.y - other.y)
 
-        
+    def __mul__(self, other):
+        if isinstance(other, Vector2D):
+            return Vector2D(self.x * other.x, self.y * other.y)
+        return Vector2D(self.x * other, self.y * other)
 
+    __rmul__ = __mul__
 
+    def __truediv__(self, other):
+        if isinstance(other, Vector2D):
+            return Vector2D(self.x / other.x, self.y / other.y)
+        return Vector2D(self.x / other, self.y / other)
 
+    def __neg__(self):
+        return Vector2D(-self.x, -self.y)
 
+    def __abs__(self):
+        return self.mag()
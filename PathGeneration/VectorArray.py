@@ -0,0 +1,112 @@
+import numpy
+from Vector2D import Vector2D
+
+class VectorArray(object):
+    """Many 2D vectors in one contiguous (N, 2) float64 buffer"""
+    __slots__ = ("data",)
+
+    def __init__(self, points):
+        if isinstance(points, VectorArray):
+            points = points.data
+        elif len(points) and isinstance(points[0], Vector2D):
+            points = [(p.x, p.y) for p in points]
+        self.data = numpy.ascontiguousarray(points, dtype=numpy.float64).reshape(-1, 2)
+
+    #Wraps an existing (N, 2) array without copying it
+    @classmethod
+    def wrap(cls, data):
+        array = cls.__new__(cls)
+        array.data = data
+        return array
+
+    def __len__(self):
+        return len(self.data)
+
+    #v[i] is a Vector2D, v[i:j] is a VectorArray sharing the buffer
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return VectorArray.wrap(self.data[index])
+        x, y = self.data[index]
+        return Vector2D(float(x), float(y))
+
+    def __iter__(self):
+        for x, y in self.data.tolist():
+            yield Vector2D(x, y)
+
+    #Lets numpy use the buffer directly, numpy.asarray(v)
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None or dtype == self.data.dtype:
+            return self.data
+        return self.data.astype(dtype)
+
+    def __repr__(self):
+        return "VectorArray({} points)".format(len(self.data))
+
+    @property
+    def x(self):
+        return self.data[:, 0]
+
+    @property
+    def y(self):
+        return self.data[:, 1]
+
+    def copy(self):
+        return VectorArray.wrap(self.data.copy())
+
+    def toVectors(self):
+        return list(self)
+
+    #Works out what other is: another VectorArray, a Vector2D or a number
+    @staticmethod
+    def _operand(other):
+        if isinstance(other, VectorArray):
+            return other.data
+        if isinstance(other, Vector2D):
+            return numpy.array((other.x, other.y))
+        return other
+
+    #Elementwise operations, the same as the Vector2D methods
+    def add(self, other):
+        return VectorArray.wrap(self.data + self._operand(other))
+
+    def sub(self, other):
+        return VectorArray.wrap(self.data - self._operand(other))
+
+    def mult(self, other):
+        return VectorArray.wrap(self.data * self._operand(other))
+
+    def div(self, other):
+        return VectorArray.wrap(self.data / self._operand(other))
+
+    __add__ = add
+    __sub__ = sub
+    __mul__ = mult
+    __rmul__ = mult
+    __truediv__ = div
+
+    def __neg__(self):
+        return VectorArray.wrap(-self.data)
+
+    #Magnitude of every vector
+    def mag(self):
+        return numpy.hypot(self.data[:, 0], self.data[:, 1])
+
+    #Distance from every vector to other
+    def dist(self, other):
+        d = self.data - self._operand(other)
+        return numpy.hypot(d[:, 0], d[:, 1])
+
+    #Dot product of every vector with other
+    def dot(self, other):
+        o = self._operand(other)
+        if isinstance(o, numpy.ndarray) and o.ndim == 2:
+            return numpy.einsum("ij,ij->i", self.data, o)
+        return self.data.dot(o)
+
+    #Angle every vector points at, same as Vector2D.heading()
+    def heading(self):
+        return numpy.arctan2(self.data[:, 1], self.data[:, 0])
+
+    #Vectors from each point to the next one, N - 1 of them
+    def segments(self):
+        return VectorArray.wrap(numpy.diff(self.data, axis=0))
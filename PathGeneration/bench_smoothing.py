@@ -0,0 +1,72 @@
+#Times smoothPath() against the array smoothers on paths of 100, 1k and 10k
+#points and checks they end up at the same path
+#
+#   python3 bench_smoothing.py [--reference-limit N]
+#
+#smoothPath() gets slow quickly, it is only run up to --reference-limit points
+
+import argparse
+import math
+import time
+
+import numpy
+
+from Vector2D import Vector2D
+from path_generating import smoothPath, a, b, t
+from smoothing import toArray, smoothPathArray, smoothPathDirect, smoothPathSOR
+
+SIZES = [100, 1000, 10000]
+
+#Zig-zag of waypoints with points every 6 inches along it, like the output of
+#injectPoints()
+def makePath(n, spacing=6.0, legLength=20):
+    points = []
+    heading = 0.0
+    x, y = 0.0, 0.0
+    for i in range(n):
+        if i % legLength == 0:
+            heading = math.radians(30) if heading <= 0 else math.radians(-30)
+        points.append(Vector2D(x, y))
+        x += spacing * math.cos(heading)
+        y += spacing * math.sin(heading)
+    return points
+
+def timeIt(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the path smoothers")
+    parser.add_argument("--reference-limit", type=int, default=1000,
+                        help="largest path to run the original smoothPath() on")
+    args = parser.parse_args()
+
+    print("{:>6}  {:>12}  {:>12}  {:>12}  {:>12}  {:>8}  {:>8}  {:>10}".format(
+        "points", "smoothPath", "jacobi", "sor", "direct", "x jacobi", "x direct", "max diff"))
+
+    for n in SIZES:
+        path = makePath(n)
+        array = toArray(path)
+
+        jacobiTime, jacobi = timeIt(smoothPathArray, array, a, b, t)
+        sorTime, sor = timeIt(smoothPathSOR, array, a, b, t)
+        directTime, direct = timeIt(smoothPathDirect, array, a, b)
+
+        #The fixed point is exact for the direct solve, the iterative ones
+        #stop within the tolerance of it
+        if n <= args.reference_limit:
+            referenceTime, reference = timeIt(smoothPath, path, a, b, t)
+            reference = toArray(reference)
+            diff = max(numpy.abs(reference - direct).max(), numpy.abs(jacobi - direct).max(),
+                       numpy.abs(sor - direct).max())
+            print("{:>6}  {:>10.1f}ms  {:>10.1f}ms  {:>10.1f}ms  {:>10.2f}ms  {:>7.0f}x  {:>7.0f}x  {:>10.4f}".format(
+                n, referenceTime * 1000, jacobiTime * 1000, sorTime * 1000, directTime * 1000,
+                referenceTime / jacobiTime, referenceTime / directTime, diff))
+        else:
+            diff = max(numpy.abs(jacobi - direct).max(), numpy.abs(sor - direct).max())
+            print("{:>6}  {:>12}  {:>10.1f}ms  {:>10.1f}ms  {:>10.2f}ms  {:>8}  {:>8}  {:>10.4f}".format(
+                n, "-", jacobiTime * 1000, sorTime * 1000, directTime * 1000, "-", "-", diff))
+
+if __name__ == "__main__":
+    main()
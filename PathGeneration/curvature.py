@@ -0,0 +1,47 @@
+import numpy
+
+#Curvature of a whole path at once, from the circle through every point and
+#its two neighbours.  For the triangle with sides a, b and c and area A
+#
+#    k = 1 / r = 4A / (abc)
+#
+#and 2A is the cross product of two of the sides, so there is nothing to
+#divide by zero when the points are in a line: A is 0 and so is k.  The end
+#points have no circle and get 0, like getCurvature() in path_generating.py.
+
+#Returns the curvature at every point of an (N, 2) path (or VectorArray).
+#With signed=True left turns are positive and right turns negative.  With
+#headings=True also returns the direction of travel at every point in
+#radians, the same angle as Vector2D.heading()
+def getCurvatureArray(path, signed=False, headings=False):
+    points = numpy.asarray(path, dtype=numpy.float64)
+    n = len(points)
+    curvature = numpy.zeros(n)
+
+    if n >= 3:
+        side1 = points[1:-1] - points[:-2]
+        side2 = points[2:] - points[1:-1]
+        side3 = points[2:] - points[:-2]
+
+        cross = side1[:, 0] * side3[:, 1] - side1[:, 1] * side3[:, 0]
+        if not signed:
+            cross = numpy.abs(cross)
+        lengths = (numpy.hypot(side1[:, 0], side1[:, 1]) *
+                   numpy.hypot(side2[:, 0], side2[:, 1]) *
+                   numpy.hypot(side3[:, 0], side3[:, 1]))
+
+        #Repeated points leave a zero length side, call those straight too
+        numpy.divide(2.0 * cross, lengths, out=curvature[1:-1], where=lengths > 0)
+
+    if not headings:
+        return curvature
+    return curvature, getHeadings(points)
+
+#Direction of travel at every point, from the neighbouring points on either
+#side (one sided at the ends)
+def getHeadings(path):
+    points = numpy.asarray(path, dtype=numpy.float64)
+    if len(points) < 2:
+        return numpy.zeros(len(points))
+    tangent = numpy.gradient(points, axis=0)
+    return numpy.arctan2(tangent[:, 1], tangent[:, 0])
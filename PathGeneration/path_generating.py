@@ -1,17 +1,67 @@
+#Turns waypoint files into injected, smoothed paths with their curvature
+#
+#   python3 path_generating.py [--output DIR] [--format npz|npy] [--plot] [--jobs N] INPUT...
+#
+#INPUT is a waypoint file or a directory of them, .txt (x y per line), .csv
+#(x,y per row, a header row is skipped) or .json (a list of [x, y] pairs or of
+#{"x": ..., "y": ...}, or an object with them under "points").  Every route
+#is written next to the input, or into --output, as NAME.npz with straight,
+#smoothed and curvature arrays, or with --format npy as one (N, 3) array of
+#the smoothed x, y and curvature.  Directories are done in parallel.
+
+import argparse
+import concurrent.futures
 import copy
+import csv
+import json
 import math
-from Plot import Plot
+import os
+import sys
+import numpy
 from Vector2D import Vector2D
+from VectorArray import VectorArray
+from curvature import getCurvatureArray
+from smoothing import smoothPathArray, smoothPathDirect, resmoothPath
+
+WAYPOINT_EXTENSIONS = (".txt", ".csv", ".json")
+
+#Read the coordinates file into a list of 2D vectors
+def readCoordinates(filename):
+    return [Vector2D(float(x), float(y)) for x, y in readWaypoints(filename)]
+
+#Reads a waypoint file into an (N, 2) array, the format comes from the extension
+def readWaypoints(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    with open(filename, "r", newline="") as file:
+        if extension == ".json":
+            points = _jsonPoints(json.load(file))
+        elif extension == ".csv":
+            points = _csvPoints(csv.reader(file))
+        else:
+            points = [line.split()[:2] for line in file if line.strip()]
 
-#Open the file
-file = open("Coordinates.txt", "r+")
-coords = []
+    points = numpy.array(points, dtype=numpy.float64)
+    if points.ndim != 2 or points.shape[1] != 2 or len(points) < 2:
+        raise ValueError("{}: needs at least 2 x, y waypoints".format(filename))
+    return points
 
-#Put coordinates into a list of 2D vectors
-for i in file:
-    s = i.split()
-    coords.append(Vector2D(float(s[0]), float(s[1])))
-file.close()
+def _jsonPoints(data):
+    if isinstance(data, dict):
+        data = data["points"]
+    return [(p["x"], p["y"]) if isinstance(p, dict) else p[:2] for p in data]
+
+def _csvPoints(rows):
+    points = []
+    for row in rows:
+        if not row or not row[0].strip():
+            continue
+        try:
+            points.append((float(row[0]), float(row[1])))
+        except ValueError:
+            #Header row
+            if points:
+                raise
+    return points
 
 #Generate Points and make a smooth path
 #Adds more points given coordinates
@@ -28,6 +78,52 @@ def injectPoints(coords):
             newPoints.append(coords[i].add(vector.mult(Vector2D(j, j))))
     newPoints.append(coords[len(coords) - 1])
     return newPoints
+
+#Same points as injectPoints() without a Vector2D per point, takes a list of
+#Vector2D or a VectorArray and returns a VectorArray
+def injectPointsArray(coords, spacing=6):
+    points = VectorArray(coords).data
+    segments = numpy.diff(points, axis=0)
+    lengths = numpy.hypot(segments[:, 0], segments[:, 1])
+    counts = numpy.ceil(lengths / spacing).astype(int)
+
+    #Which segment each new point is on and how many steps along it
+    segment = numpy.repeat(numpy.arange(len(segments)), counts)
+    step = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+
+    #Zero length segments get no points, so their direction is never used
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        direction = segments / lengths[:, numpy.newaxis]
+    newPoints = points[segment] + direction[segment] * (step * spacing)[:, numpy.newaxis]
+    return VectorArray.wrap(numpy.vstack((newPoints, points[-1:])))
+
+#Smoothed path with points only as close together as the curvature needs.
+#An arc of radius R cut by a chord of length s bulges s^2 / (8R) away from it,
+#so points at most sqrt(8 R tolerance) apart keep the straight lines between
+#them within tolerance of the curve.  The curve comes from smoothing points
+#every `spacing` first, then only enough of those are kept that the spacing
+#never goes over what the curvature around it allows, or maxSpacing on the
+#straights.  The result is already smoothed, smoothing it again with a and b
+#would pull it somewhere else since the points aren't evenly spaced
+def injectPointsAdaptive(coords, tolerance, spacing=6, maxSpacing=48):
+    dense = smoothPathDirect(injectPointsArray(coords, spacing).data, a, b)
+    curvature = getCurvatureArray(dense)
+
+    with numpy.errstate(divide="ignore"):
+        allowed = numpy.sqrt(8.0 * tolerance / curvature)
+    allowed = numpy.clip(allowed, spacing, maxSpacing)
+    #A step has to fit the tightest point at either end of it
+    steps = numpy.hypot(*numpy.diff(dense, axis=0).T)
+    stepAllowed = numpy.minimum(allowed[:-1], allowed[1:])
+
+    #How many allowed spacings have gone by at every point.  Each kept point
+    #is the furthest one less than a whole spacing on from the last
+    budget = numpy.concatenate(([0.0], numpy.cumsum(steps / stepAllowed)))
+    keep = [0]
+    while keep[-1] < len(dense) - 1:
+        i = keep[-1]
+        keep.append(max(i + 1, numpy.searchsorted(budget, budget[i] + 1.0, side="right") - 1))
+    return VectorArray.wrap(dense[keep])
    
 #Smooths the injected points on the path
 def smoothPath(path, a, b, tol):
@@ -46,18 +142,20 @@ def smoothPath(path, a, b, tol):
     return newPath
 
 #Calulate the curvature between points on the path
+#Works on a copy, the nudge that keeps it from dividing by zero used to end
+#up in the caller's path.  curvature.getCurvatureArray() is the fast version
 def getCurvature(path):
     points = path.copy()
     pCurve = []
     pCurve.append(0)
 
     for i in range(1, len(path) - 1):
-        path[i] = path[i].add(Vector2D(0.001, 0))
-        k1 = 0.5 * ((path[i].x ** 2) + (path[i].y ** 2) - (path[i - 1].x ** 2) - (path[i - 1].y ** 2)) / (path[i].x - path[i - 1].x)
-        k2 = (path[i].y - path[i - 1].y) / (path[i].x - path[i - 1].x)
-        b = 0.5 * ((path[i - 1].x ** 2) - 2 * path[i - 1].x * k1 + (path[i - 1].y ** 2) - (path[i + 1].x ** 2) + 2 * path[i + 1].x * k1 - (path[i + 1].y ** 2)) / (path[i + 1].x * k2 - path[i + 1].y + path[i - 1].y - path[i - 1].x * k2)
+        points[i] = points[i].add(Vector2D(0.001, 0))
+        k1 = 0.5 * ((points[i].x ** 2) + (points[i].y ** 2) - (points[i - 1].x ** 2) - (points[i - 1].y ** 2)) / (points[i].x - points[i - 1].x)
+        k2 = (points[i].y - points[i - 1].y) / (points[i].x - points[i - 1].x)
+        b = 0.5 * ((points[i - 1].x ** 2) - 2 * points[i - 1].x * k1 + (points[i - 1].y ** 2) - (points[i + 1].x ** 2) + 2 * points[i + 1].x * k1 - (points[i + 1].y ** 2)) / (points[i + 1].x * k2 - points[i + 1].y + points[i - 1].y - points[i - 1].x * k2)
         a = k1 - k2 * b
-        r = math.sqrt(((path[i].x - a) ** 2) + ((path[i].y - b) ** 2))
+        r = math.sqrt(((points[i].x - a) ** 2) + ((points[i].y - b) ** 2))
         pCurve.append(1 / r)
     pCurve.append(0)
     return pCurve
@@ -69,7 +167,140 @@ b = 0.97
 a = 1 - b
 t = 0.001
 
-straightPath = injectPoints(coords)
-smoothedPath = smoothPath(straightPath, a, b, t)
+#Re-smooth previousSmoothed (oldCoords' path) near waypoints moved to newCoords
+def resmoothWaypoints(oldCoords, newCoords, previousSmoothed, spacing=6):
+    oldPoints = VectorArray(oldCoords).data
+    newPoints = VectorArray(newCoords).data
+    if len(oldPoints) != len(newPoints):
+        raise ValueError("waypoints were added or removed, smooth the whole path")
+    oldStraight = injectPointsArray(oldPoints, spacing).data
+    newStraight = injectPointsArray(newPoints, spacing).data
+    if len(previousSmoothed) != len(oldStraight):
+        raise ValueError("previousSmoothed doesn't go with oldCoords")
+
+    moved = numpy.hypot(*(newPoints - oldPoints).T)
+    changed = numpy.flatnonzero(moved > 0)
+    if len(changed) == 0:
+        return numpy.array(previousSmoothed, dtype=numpy.float64)
+
+    #Segments either side of the moved waypoints get new injected points,
+    #the ones before keep their indices and the ones after keep theirs
+    #counted from the end
+    def starts(points):
+        lengths = numpy.hypot(*numpy.diff(points, axis=0).T)
+        return numpy.concatenate(([0], numpy.cumsum(numpy.ceil(lengths / spacing).astype(int))))
+    oldStarts, newStarts = starts(oldPoints), starts(newPoints)
+    first = max(changed[0] - 1, 0)
+    last = min(changed[-1] + 1, len(newPoints) - 1)
+    start = newStarts[first]
+    oldEnd, newEnd = oldStarts[last] + 1, newStarts[last] + 1
+
+    guess = numpy.concatenate((previousSmoothed[:start], newStraight[start:newEnd], previousSmoothed[oldEnd:]))
+    #The smoothed points have to move by as much as the waypoints did plus
+    #however far smoothing had pulled them off the old straight path
+    change = moved.max() + numpy.abs(previousSmoothed[start:oldEnd] - oldStraight[start:oldEnd]).max()
+    return resmoothPath(newStraight, guess, start, newEnd, a, b, t, change)
+
+#Inject, smooth and curvature for one route, returns a dict of arrays
+#With a tolerance the smoothed path comes from injectPointsAdaptive()
+def generatePath(waypoints, spacing=6, direct=False, tolerance=None):
+    straightPath = injectPointsArray(waypoints, spacing).data
+    if tolerance is not None:
+        smoothedPath = injectPointsAdaptive(waypoints, tolerance, spacing).data
+    elif direct:
+        smoothedPath = smoothPathDirect(straightPath, a, b)
+    else:
+        smoothedPath = smoothPathArray(straightPath, a, b, t)
+    return {"waypoints": numpy.asarray(waypoints, dtype=numpy.float64),
+            "straight": straightPath,
+            "smoothed": smoothedPath,
+            "curvature": getCurvatureArray(smoothedPath)}
+
+def writePath(filename, path, format="npz"):
+    if format == "npy":
+        numpy.save(filename, numpy.column_stack((path["smoothed"], path["curvature"])))
+    else:
+        numpy.savez(filename, **path)
+
+#Waypoint files for every input, directories are searched one level deep
+def findRoutes(inputs):
+    routes = []
+    for name in inputs:
+        if os.path.isdir(name):
+            routes.extend(sorted(os.path.join(name, f) for f in os.listdir(name)
+                                 if f.lower().endswith(WAYPOINT_EXTENSIONS)))
+        else:
+            routes.append(name)
+    return routes
+
+def outputName(route, outputDir, format):
+    base = os.path.splitext(os.path.basename(route))[0] + "." + format
+    return os.path.join(outputDir if outputDir else os.path.dirname(route), base)
+
+#Does one route start to finish, run in the worker processes.  With keepPath
+#the arrays come back too, for plotting without generating them again
+def processRoute(route, output, format="npz", spacing=6, direct=False, tolerance=None, keepPath=False):
+    path = generatePath(readWaypoints(route), spacing, direct, tolerance)
+    writePath(output, path, format)
+    return route, output, len(path["smoothed"]), path if keepPath else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate smoothed paths from waypoint files")
+    parser.add_argument("inputs", nargs="+", help="waypoint files or directories of them")
+    parser.add_argument("--output", help="directory for the results, default is next to the input")
+    parser.add_argument("--format", choices=("npz", "npy"), default="npz")
+    parser.add_argument("--spacing", type=float, default=6, help="distance between injected points")
+    parser.add_argument("--direct", action="store_true",
+                        help="solve for the smoothed path directly instead of iterating")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="space the smoothed points by curvature, keeping within this of the curve")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes, default is one per CPU")
+    parser.add_argument("--plot", action="store_true", help="show every path once it is done")
+    parser.add_argument("--color", action="store_true", help="color the plotted points by curvature")
+    args = parser.parse_args(argv)
+
+    routes = findRoutes(args.inputs)
+    if not routes:
+        parser.error("no waypoint files found")
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    jobs = [(route, outputName(route, args.output, args.format), args.format, args.spacing, args.direct,
+             args.tolerance, args.plot)
+            for route in routes]
+    if len(jobs) == 1 or args.jobs == 1:
+        results = [_run(processRoute, *job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [executor.submit(_run, processRoute, *job) for job in jobs]
+            results = [f.result() for f in futures]
+
+    failed = 0
+    for job, (result, error) in zip(jobs, results):
+        if error is not None:
+            failed += 1
+            print(error if isinstance(error, ValueError) else "{}: {}".format(job[0], error), file=sys.stderr)
+        else:
+            route, output, count, _ = result
+            print("{} -> {} ({} points)".format(route, output, count))
+
+    if args.plot:
+        #Tk is only needed here, the rest runs without a display
+        from Plot import Plot
+        for (result, error) in results:
+            if error is None:
+                path = result[3]
+                Plot(VectorArray.wrap(path["straight"]), VectorArray.wrap(path["smoothed"]), 2,
+                     values=path["curvature"] if args.color else None)
+
+    return 1 if failed else 0
+
+#Returns (result, None) or (None, error) so one bad route doesn't stop the rest
+def _run(function, *args):
+    try:
+        return function(*args), None
+    except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+        return None, e
 
-Plot(straightPath, smoothedPath, 2)
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import math
+import time
+
+import numpy
+
+#Array versions of smoothPath() in path_generating.py
+#
+#A path is an (N, 2) float64 array of x, y points.  Both smoothers find the
+#same path as smoothPath(): every interior point x_i is pulled towards its
+#original position p_i with weight a and towards its neighbours with weight b,
+#which settles where
+#
+#    (a + 2b) x_i - b x_(i-1) - b x_(i+1) = a p_i
+#
+#with the first and last points left where they are.
+
+#Turns a list of Vector2D points into an (N, 2) array
+def toArray(points):
+    return numpy.array([(p.x, p.y) for p in points], dtype=numpy.float64)
+
+#Smooths the path with vectorized Jacobi sweeps, every interior point is
+#updated at once from the previous sweep.  Stops when the summed change of a
+#sweep drops below tol, like smoothPath(), or after maxIterations sweeps
+def smoothPathArray(path, a, b, tol, maxIterations=100000):
+    path = numpy.asarray(path, dtype=numpy.float64)
+    newPath = path.copy()
+    if len(path) < 3:
+        return newPath
+
+    #Two buffers that are swapped every sweep, nothing is allocated in the loop
+    nextPath = newPath.copy()
+    target = a * path[1:-1]
+    scale = 1.0 / (a + 2 * b)
+    diff = numpy.empty_like(target)
+
+    for _ in range(maxIterations):
+        inner = nextPath[1:-1]
+        numpy.add(newPath[:-2], newPath[2:], out=inner)
+        inner *= b
+        inner += target
+        inner *= scale
+
+        numpy.subtract(inner, newPath[1:-1], out=diff)
+        numpy.abs(diff, out=diff)
+        newPath, nextPath = nextPath, newPath
+        if diff.sum() < tol:
+            break
+    return newPath
+
+#Solves for the smoothed path directly with the Thomas algorithm, the system
+#is tridiagonal so this is O(N) and there is no tolerance to pick
+def smoothPathDirect(path, a, b):
+    path = numpy.asarray(path, dtype=numpy.float64)
+    newPath = path.copy()
+    n = len(path) - 2
+    if n < 1:
+        return newPath
+
+    #Right hand side, with the fixed end points moved over
+    rhs = a * path[1:-1]
+    rhs[0] += b * path[0]
+    rhs[-1] += b * path[-1]
+
+    #Forward sweep, the diagonal is a + 2b and both off diagonals are -b.
+    #The recurrences are sequential, plain floats beat numpy one row at a time
+    diag = a + 2 * b
+    cPrime = [0.0] * n
+    dx = [0.0] * n
+    dy = [0.0] * n
+    rx, ry = rhs[:, 0].tolist(), rhs[:, 1].tolist()
+    c, x, y = 0.0, 0.0, 0.0
+    for i in range(n):
+        m = diag + b * c
+        c = -b / m
+        x = (rx[i] + b * x) / m
+        y = (ry[i] + b * y) / m
+        cPrime[i], dx[i], dy[i] = c, x, y
+
+    #Back substitution
+    for i in range(n - 2, -1, -1):
+        x = dx[i] - cPrime[i] * x
+        y = dy[i] - cPrime[i] * y
+        dx[i], dy[i] = x, y
+
+    newPath[1:-1, 0] = dx
+    newPath[1:-1, 1] = dy
+    return newPath
+
+#Over-relaxation factor that converges fastest for a path of n points.  The
+#Jacobi sweep shrinks the error by rho = 2b / (a + 2b) cos(pi / (n - 1)) at
+#best, and red-black SOR does best with 2 / (1 + sqrt(1 - rho^2))
+def optimalOmega(n, a, b):
+    rho = 2 * b / (a + 2 * b) * math.cos(math.pi / max(n - 1, 2))
+    return 2.0 / (1.0 + math.sqrt(1.0 - rho * rho))
+
+#Smooths the path with red-black over-relaxed sweeps: the odd interior points
+#are updated from their even neighbours, then the even ones from the new odd
+#ones, and every update goes omega times as far as plain Gauss-Seidel would.
+#Stops when the summed change of a sweep drops below tol, after
+#maxIterations sweeps or after maxTime seconds, whichever comes first.
+#initial is a starting guess (a previous smoothed path), progress is called
+#with (iteration, change) after every sweep
+def smoothPathSOR(path, a, b, tol, omega=None, maxIterations=100000, maxTime=None,
+                  initial=None, progress=None):
+    path = numpy.asarray(path, dtype=numpy.float64)
+    newPath = path.copy() if initial is None else numpy.array(initial, dtype=numpy.float64)
+    n = len(path)
+    if n < 3:
+        return newPath
+    newPath[0], newPath[-1] = path[0], path[-1]
+
+    if omega is None:
+        omega = optimalOmega(n, a, b)
+    scale = omega / (a + 2 * b)
+    target = a * path
+    deadline = None if maxTime is None else time.perf_counter() + maxTime
+
+    #Slices for the points of each colour and their neighbours either side
+    colours = [(slice(start, n - 1, 2), slice(start - 1, n - 2, 2), slice(start + 1, n, 2))
+               for start in (1, 2)]
+    update = numpy.empty((len(range(1, n - 1, 2)), 2))
+
+    for iteration in range(1, maxIterations + 1):
+        change = 0.0
+        for points, before, after in colours:
+            step = update[:len(range(*points.indices(n)))]
+            #omega * (Gauss-Seidel value - current value)
+            numpy.add(newPath[before], newPath[after], out=step)
+            step *= b
+            step += target[points]
+            step *= scale
+            step -= omega * newPath[points]
+            newPath[points] += step
+            change += numpy.abs(step).sum()
+
+        if progress is not None:
+            progress(iteration, change)
+        if change < tol or (deadline is not None and time.perf_counter() > deadline):
+            break
+    return newPath
+
+#How many points either side of a change of size `change` the smoothed path
+#still moves by more than tol.  Away from the ends the effect of a change
+#dies off by the smaller root of b x^2 - (a + 2b) x + b = 0 every point
+def influenceRadius(a, b, change, tol):
+    if change <= tol:
+        return 0
+    diag = a + 2 * b
+    decay = (diag - math.sqrt(diag * diag - 4 * b * b)) / (2 * b)
+    return int(math.ceil(math.log(tol / change) / math.log(decay)))
+
+#Warm start for when a few points of the path have moved, like after editing
+#one waypoint.  previous is the smoothed path from before, lined up point for
+#point with path, and path[start:end] are the points that changed.  Only the
+#points within influenceRadius() of those are solved for again, the rest of
+#previous is used as it is.  change is how far the points moved, by default
+#it is taken as how far path[start:end] is from previous, which is bigger
+def resmoothPath(path, previous, start, end, a, b, tol, change=None):
+    path = numpy.asarray(path, dtype=numpy.float64)
+    newPath = numpy.array(previous, dtype=numpy.float64)
+    n = len(path)
+    if len(newPath) != n:
+        raise ValueError("previous has {} points, path has {}".format(len(newPath), n))
+    if start >= end:
+        return newPath
+
+    if change is None:
+        change = numpy.abs(path[start:end] - newPath[start:end]).max()
+    radius = influenceRadius(a, b, change, tol) + 1
+    low = max(0, start - radius)
+    high = min(n - 1, end - 1 + radius)
+
+    #The window ends stay where previous has them and pin the solve,
+    #unless they are the real ends of the path
+    window = path[low:high + 1].copy()
+    if low > 0:
+        window[0] = newPath[low]
+    if high < n - 1:
+        window[-1] = newPath[high]
+    newPath[low:high + 1] = smoothPathDirect(window, a, b)
+    return newPath
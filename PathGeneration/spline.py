@@ -0,0 +1,164 @@
+import numpy
+from velocity_profile import getTargetVelocities, limitAcceleration, getTimes, sampleProfile, splitWheels, addJerk
+
+#Paths as quintic Hermite splines through the waypoints instead of injected
+#and smoothed polylines.  Every segment between two waypoints is a 5th order
+#polynomial in t from 0 to 1 for x and y, so the position, heading and
+#curvature anywhere on it come straight from the coefficients.
+#
+#A lookup table of arc length against the spline parameter turns distances
+#along the path back into (segment, t), which is what sampling at even
+#distances or even times needs.
+#
+#Waypoints are anything with x, y and angle (pathfinder Waypoints, like the
+#AutoTrajectories lists) or (x, y, angle) tuples, angles in radians with left
+#turns positive.  Units are whatever the waypoints are in, feet for those.
+#
+#   spline = QuinticSpline(AutoTrajectories.RightRocketFar)
+#   distances, points, headings, curvature = spline.sampleDistance(0.25)
+#   center, left, right = generateSplineProfile(spline, 10, 8, 6, 2.1)
+
+#5 point Gauss-Legendre nodes on [0, 1] and their weights
+GAUSS_NODES = (numpy.array([-0.9061798459386640, -0.5384693101056831, 0.0,
+                            0.5384693101056831, 0.9061798459386640]) + 1.0) / 2.0
+GAUSS_WEIGHTS = numpy.array([0.2369268850561891, 0.4786286704993665, 0.5688888888888889,
+                             0.4786286704993665, 0.2369268850561891]) / 2.0
+
+#(x, y, angle) array from pathfinder Waypoints or tuples
+def toWaypoints(waypoints):
+    rows = [(w.x, w.y, w.angle) if hasattr(w, "angle") else tuple(w)[:3] for w in waypoints]
+    return numpy.array(rows, dtype=numpy.float64).reshape(-1, 3)
+
+#Polynomial coefficients, lowest power first, for the quintic with position p,
+#first derivative v and second derivative a given at t = 0 and t = 1
+def hermiteCoefficients(p0, v0, a0, p1, v1, a1):
+    return numpy.stack((p0,
+                        v0,
+                        a0 / 2.0,
+                        -10 * p0 - 6 * v0 - 1.5 * a0 + 0.5 * a1 - 4 * v1 + 10 * p1,
+                        15 * p0 + 8 * v0 + 1.5 * a0 - a1 + 7 * v1 - 15 * p1,
+                        -6 * p0 - 3 * v0 - 0.5 * a0 + 0.5 * a1 - 3 * v1 + 6 * p1), axis=1)
+
+class QuinticSpline(object):
+    #The tangent at every waypoint points along its angle and is tangentScale
+    #times as long as the straight line to the next waypoint.  The second
+    #derivative is 0 at the waypoints, like pathfinder's quintic fit, so the
+    #path is straight for an instant at every waypoint.  tableSize is how
+    #many arc length table entries each segment gets
+    def __init__(self, waypoints, tangentScale=1.0, tableSize=64):
+        waypoints = toWaypoints(waypoints)
+        if len(waypoints) < 2:
+            raise ValueError("a spline needs at least 2 waypoints")
+
+        start, end = waypoints[:-1], waypoints[1:]
+        chord = numpy.hypot(end[:, 0] - start[:, 0], end[:, 1] - start[:, 1])[:, numpy.newaxis]
+        startTangent = chord * tangentScale * numpy.column_stack((numpy.cos(start[:, 2]), numpy.sin(start[:, 2])))
+        endTangent = chord * tangentScale * numpy.column_stack((numpy.cos(end[:, 2]), numpy.sin(end[:, 2])))
+        zero = numpy.zeros_like(startTangent)
+
+        #(segments, 6, 2) coefficients and those of the first two derivatives
+        self.coefficients = hermiteCoefficients(start[:, :2], startTangent, zero, end[:, :2], endTangent, zero)
+        self.first = self.coefficients[:, 1:] * numpy.arange(1, 6)[:, numpy.newaxis]
+        self.second = self.first[:, 1:] * numpy.arange(1, 5)[:, numpy.newaxis]
+        self.segments = len(self.coefficients)
+
+        self.buildTable(tableSize)
+
+    #Arc length from the start to every 1 / tableSize step of the parameter
+    def buildTable(self, tableSize):
+        self.tableParameters = numpy.linspace(0.0, self.segments, self.segments * tableSize + 1)
+        self.tableDistances = numpy.concatenate(([0.0], numpy.cumsum(
+            self.lengthBetween(self.tableParameters[:-1], self.tableParameters[1:]))))
+        self.length = self.tableDistances[-1]
+
+    #The parameter u runs from 0 to the number of segments, segment floor(u)
+    #at t = u - floor(u)
+    def split(self, u):
+        u = numpy.asarray(u, dtype=numpy.float64)
+        segment = numpy.clip(numpy.floor(u).astype(numpy.intp), 0, self.segments - 1)
+        return segment, u - segment
+
+    def polynomial(self, coefficients, u):
+        segment, t = self.split(u)
+        powers = t[..., numpy.newaxis] ** numpy.arange(coefficients.shape[1])
+        return numpy.einsum("...k,...kj->...j", powers, coefficients[segment])
+
+    def position(self, u):
+        return self.polynomial(self.coefficients, u)
+
+    def velocity(self, u):
+        return self.polynomial(self.first, u)
+
+    def heading(self, u):
+        d = self.velocity(u)
+        return numpy.arctan2(d[..., 1], d[..., 0])
+
+    #Signed curvature, left turns positive
+    def curvature(self, u):
+        d1 = self.velocity(u)
+        d2 = self.polynomial(self.second, u)
+        cross = d1[..., 0] * d2[..., 1] - d1[..., 1] * d2[..., 0]
+        speed = numpy.hypot(d1[..., 0], d1[..., 1])
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return numpy.where(speed > 0, cross / speed ** 3, 0.0)
+
+    #Arc length from u0 to u1 by Gauss-Legendre, both on the same segment
+    def lengthBetween(self, u0, u1):
+        u0 = numpy.asarray(u0, dtype=numpy.float64)
+        step = numpy.asarray(u1, dtype=numpy.float64) - u0
+        nodes = u0[..., numpy.newaxis] + step[..., numpy.newaxis] * GAUSS_NODES
+        #Keep the nodes on u0's segment when u1 is the end of it
+        segment, _ = self.split(u0)
+        nodes = numpy.minimum(nodes, segment[..., numpy.newaxis] + 1.0)
+        d = self.velocity(nodes)
+        return step * (numpy.hypot(d[..., 0], d[..., 1]) * GAUSS_WEIGHTS).sum(axis=-1)
+
+    #Spline parameter at every distance along the path.  The table gives a
+    #first guess and a Newton step on the exact arc length finishes it
+    def parameterAt(self, distances):
+        distances = numpy.clip(numpy.asarray(distances, dtype=numpy.float64), 0.0, self.length)
+        i = numpy.clip(numpy.searchsorted(self.tableDistances, distances, side="right") - 1,
+                       0, len(self.tableDistances) - 2)
+        d0, d1 = self.tableDistances[i], self.tableDistances[i + 1]
+        u0, u1 = self.tableParameters[i], self.tableParameters[i + 1]
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            fraction = numpy.where(d1 > d0, (distances - d0) / (d1 - d0), 0.0)
+        u = u0 + fraction * (u1 - u0)
+
+        d = self.velocity(u)
+        speed = numpy.hypot(d[..., 0], d[..., 1])
+        error = d0 + self.lengthBetween(u0, u) - distances
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            u = numpy.where(speed > 0, u - error / speed, u)
+        return numpy.clip(u, u0, u1)
+
+    #Points, headings and curvature at distances along the path
+    def atDistance(self, distances):
+        u = self.parameterAt(distances)
+        return self.position(u), self.heading(u), self.curvature(u)
+
+    #The path every `spacing` along it, plus the end.  Returns (distances,
+    #points, headings, curvature)
+    def sampleDistance(self, spacing):
+        distances = numpy.append(numpy.arange(0.0, self.length, spacing), self.length)
+        return (distances,) + self.atDistance(distances)
+
+#Center, left and right wheel segments every period seconds along the spline,
+#the same as velocity_profile.generateProfile() gives for a point path.  The
+#speed limits are worked out on a grid of `resolution` along the path and the
+#sampled positions are then put exactly on the spline
+def generateSplineProfile(spline, maxVelocity, maxAcceleration, kTurn, wheelbase, period=0.02,
+                          resolution=0.05, startVelocity=0.0, endVelocity=0.0):
+    distances, points, headings, curvature = spline.sampleDistance(resolution)
+    velocities = getTargetVelocities(curvature, maxVelocity, kTurn, wheelbase)
+    velocities = limitAcceleration(distances, velocities, maxAcceleration, startVelocity, endVelocity)
+    times = getTimes(distances, velocities)
+
+    center = sampleProfile(points, distances, velocities, times, headings, period)
+    sampled, heading, _ = spline.atDistance(center.position)
+    center.x = sampled[:, 0]
+    center.y = sampled[:, 1]
+    center.heading = numpy.unwrap(heading)
+
+    left, right = splitWheels(center, period, wheelbase)
+    return addJerk(center, period), addJerk(left, period), addJerk(right, period)
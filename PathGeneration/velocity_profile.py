@@ -0,0 +1,137 @@
+import numpy
+from curvature import getCurvatureArray
+
+#Turns a smoothed path into left and right wheel segments every `period`
+#seconds, like pathfinder's generate() and TankModifier but all with arrays
+#
+#  1. Distance along the path to every point
+#  2. The fastest each point can be taken at, min(maxVelocity, kTurn / curvature)
+#     (and slow enough that the outside wheel stays under maxVelocity)
+#  3. Limit the acceleration going forwards from the start and then
+#     backwards from the end, so the robot can speed up and stop in time
+#  4. Time stamp every point and sample the profile every period seconds
+#
+#Units are whatever the path is in, feet for anything going to the robot.
+#Headings are in radians with left turns positive.
+
+#Same fields as a pathfinder Segment, the records can be used in their place
+SEGMENT_DTYPE = numpy.dtype([("dt", numpy.float64),
+                             ("x", numpy.float64),
+                             ("y", numpy.float64),
+                             ("position", numpy.float64),
+                             ("velocity", numpy.float64),
+                             ("acceleration", numpy.float64),
+                             ("jerk", numpy.float64),
+                             ("heading", numpy.float64)])
+
+#Distance along the path to every point, starting at 0
+def getDistances(path):
+    points = numpy.asarray(path, dtype=numpy.float64)
+    steps = numpy.hypot(*numpy.diff(points, axis=0).T)
+    return numpy.concatenate(([0.0], numpy.cumsum(steps)))
+
+#Fastest speed at every point from the curvature alone
+def getTargetVelocities(curvature, maxVelocity, kTurn, wheelbase=0.0):
+    k = numpy.abs(curvature)
+    #The outside wheel goes (1 + k * wheelbase / 2) times faster than the middle
+    velocities = maxVelocity / (1.0 + k * wheelbase / 2.0)
+    with numpy.errstate(divide="ignore"):
+        turn = numpy.where(k > 0, kTurn / k, numpy.inf)
+    return numpy.minimum(velocities, turn)
+
+#Limits the change in speed between points to maxAcceleration.  Going
+#forwards v_i^2 <= v_j^2 + 2 a (s_i - s_j) for every earlier point j, which is
+#a running minimum, so both passes are a single numpy accumulate
+def limitAcceleration(distances, velocities, maxAcceleration, startVelocity=0.0, endVelocity=0.0):
+    twoA = 2.0 * maxAcceleration
+    squared = numpy.square(velocities)
+    squared[0] = min(squared[0], startVelocity ** 2)
+    squared[-1] = min(squared[-1], endVelocity ** 2)
+
+    #Forwards from the start
+    squared = numpy.minimum(squared, twoA * distances + numpy.minimum.accumulate(squared - twoA * distances))
+    #Backwards from the end
+    backwards = numpy.minimum.accumulate((squared + twoA * distances)[::-1])[::-1]
+    squared = numpy.minimum(squared, backwards - twoA * distances)
+
+    return numpy.sqrt(numpy.maximum(squared, 0.0))
+
+#Time to reach every point, the speed changes evenly between points
+def getTimes(distances, velocities):
+    steps = numpy.diff(distances)
+    speeds = velocities[:-1] + velocities[1:]
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        dt = numpy.where(speeds > 0, 2.0 * steps / speeds, 0.0)
+    return numpy.concatenate(([0.0], numpy.cumsum(dt)))
+
+#Samples the profile every period seconds.  Returns the segments for the
+#middle of the robot
+def sampleProfile(points, distances, velocities, times, headings, period):
+    sampleTimes = numpy.arange(0.0, times[-1], period)
+    sampleTimes = numpy.append(sampleTimes, times[-1])
+
+    #Which step of the path every sample is on, constant acceleration within it
+    index = numpy.clip(numpy.searchsorted(times, sampleTimes, side="right") - 1, 0, len(times) - 2)
+    tau = sampleTimes - times[index]
+    steps = distances[index + 1] - distances[index]
+    stepTimes = times[index + 1] - times[index]
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        acceleration = numpy.where(stepTimes > 0, (velocities[index + 1] - velocities[index]) / stepTimes, 0.0)
+        velocity = velocities[index] + acceleration * tau
+        travelled = numpy.minimum(velocities[index] * tau + 0.5 * acceleration * tau ** 2, steps)
+        fraction = numpy.where(steps > 0, travelled / steps, 0.0)
+
+    segments = numpy.zeros(len(sampleTimes), dtype=SEGMENT_DTYPE).view(numpy.recarray)
+    segments.dt = period
+    segments.x = points[index, 0] + fraction * (points[index + 1, 0] - points[index, 0])
+    segments.y = points[index, 1] + fraction * (points[index + 1, 1] - points[index, 1])
+    segments.position = distances[index] + travelled
+    segments.velocity = velocity
+    segments.acceleration = acceleration
+
+    unwrapped = numpy.unwrap(headings)
+    segments.heading = unwrapped[index] + fraction * (unwrapped[index + 1] - unwrapped[index])
+    return segments
+
+#Left and right wheel segments for a drive with the given wheelbase, the
+#wheels move along the path's offsets at v * (1 -/+ k * wheelbase / 2)
+def splitWheels(center, period, wheelbase):
+    heading = center.heading
+    turnRate = numpy.gradient(heading, period) if len(heading) > 1 else numpy.zeros(len(heading))
+    half = wheelbase / 2.0
+
+    wheels = []
+    for side in (1.0, -1.0):
+        wheel = center.copy()
+        wheel.x = center.x - side * half * numpy.sin(heading)
+        wheel.y = center.y + side * half * numpy.cos(heading)
+        wheel.velocity = center.velocity - side * half * turnRate
+        #Trapezoidal integration of the wheel speed
+        wheel.position = numpy.concatenate(([0.0], numpy.cumsum((wheel.velocity[1:] + wheel.velocity[:-1]) * period / 2.0)))
+        wheel.acceleration = numpy.gradient(wheel.velocity, period) if len(wheel) > 1 else 0.0
+        wheels.append(wheel)
+    return wheels
+
+#Fills in jerk from the change in acceleration
+def addJerk(segments, period):
+    if len(segments) > 1:
+        segments.jerk[1:] = numpy.diff(segments.acceleration) / period
+    return segments
+
+#The whole thing.  Returns (center, left, right) segment arrays sampled every
+#period seconds, each one a numpy record array with SEGMENT_DTYPE fields
+def generateProfile(path, maxVelocity, maxAcceleration, kTurn, wheelbase, period=0.02,
+                    startVelocity=0.0, endVelocity=0.0):
+    points = numpy.asarray(path, dtype=numpy.float64)
+    if len(points) < 2:
+        raise ValueError("a profile needs at least 2 points")
+
+    distances = getDistances(points)
+    curvature, headings = getCurvatureArray(points, signed=True, headings=True)
+    velocities = getTargetVelocities(curvature, maxVelocity, kTurn, wheelbase)
+    velocities = limitAcceleration(distances, velocities, maxAcceleration, startVelocity, endVelocity)
+    times = getTimes(distances, velocities)
+
+    center = sampleProfile(points, distances, velocities, times, headings, period)
+    left, right = splitWheels(center, period, wheelbase)
+    return addJerk(center, period), addJerk(left, period), addJerk(right, period)
@@ -1,9 +1,7 @@
 import math
 import wpilib
 
-import pathfinder as pf
-
-import pickle
+import trajectoryfile
 
 #from ctre.pigeonimu import PigeonIMU
 #from ctre.pigeonimu import PigeonIMU_StatusFrame
@@ -247,39 +245,19 @@ class MyRobot(wpilib.TimedRobot):
     self.rightTalonMaster.set(ControlMode.MotionProfile, 0)
 
     if not self.isSimulation():
-      with open("/home/lvuser/traj", "rb") as fp:
-          trajectory = pickle.load(fp)
+      path = "/home/lvuser/traj.bin"
     else:
-      with open("/home/ubuntu/traj", "rb") as fp:
-          trajectory = pickle.load(fp)
-
-    print("Length of trajectory: " + str(len(trajectory)))  
-    modifier = pf.modifiers.TankModifier(trajectory).modify(2.1) #Wheelbase in feet
-
-    self.leftTrajectory = modifier.getLeftTrajectory()
-    self.rightTrajectory = modifier.getRightTrajectory()
-
-    for i in range(len(trajectory)):
-      leftSeg = self.leftTrajectory[i]
-      rightSeg = self.rightTrajectory[i]
-
-      velCorrection = (rightSeg.velocity - leftSeg.velocity) * self.VELOCITY_MULTIPLIER
+      path = "/home/ubuntu/traj.bin"
 
-      lposition = self.inchesToUnits((leftSeg.position) * 12)
-      rposition = self.inchesToUnits((rightSeg.position) * 12)
-      aux_position = 0
-      slot0 = self.PRIMARY_PID_LOOP_GAINS_SLOT
-      slot1 = self.AUX_PID_LOOP_GAINS_SLOT
-      timeDur = 0
-      zeroPos = i == 0
-      isLastPoint = i == len(trajectory) - 1
-      lvelocity = self.inchesToUnits(leftSeg.velocity * 12) / 10
-      rvelocity = self.inchesToUnits(rightSeg.velocity * 12) / 10
-
-      '''There was no empty constructor.'''
-      print(f'position: {lposition}, aux_position: {aux_position}, lvelcoity: {lvelocity}, rvelocity: {rvelocity}')
-      self.leftTrajectory[i] = TrajectoryPoint(lposition, lvelocity, aux_position, slot0, slot1, isLastPoint, zeroPos, timeDur)
-      self.rightTrajectory[i] = TrajectoryPoint(rposition, rvelocity, aux_position, slot0, slot1, isLastPoint, zeroPos, timeDur)
+    '''
+    trajectory_generator.py has already done the TankModifier and converted
+    everything to Talon units, all that is left is making the points
+    '''
+    units_per_foot = trajectoryfile.units_per_foot(self.ENCODER_COUNTS_PER_REV, self.WHEEL_DIAMETER)
+    with trajectoryfile.TrajectoryFile(path, units_per_foot) as trajectory:
+      print("Length of trajectory: " + str(len(trajectory)))
+      self.leftTrajectory = self.trajectory_points(trajectory.left_position, trajectory.left_velocity, trajectory.flags)
+      self.rightTrajectory = self.trajectory_points(trajectory.right_position, trajectory.right_velocity, trajectory.flags)
 
     if not self.isSimulation():
       for point in self.leftTrajectory:        
@@ -471,6 +449,15 @@ class MyRobot(wpilib.TimedRobot):
       print("MODE: disabledPeriodic")
     self.stick.pulseRumble(5)
 
+  def trajectory_points(self, positions, velocities, flags):
+    slot0 = self.PRIMARY_PID_LOOP_GAINS_SLOT
+    slot1 = self.AUX_PID_LOOP_GAINS_SLOT
+    last = trajectoryfile.FLAG_LAST_POINT
+    zero = trajectoryfile.FLAG_ZERO_POSITION
+    '''There was no empty constructor.'''
+    return [TrajectoryPoint(position, velocity, 0, slot0, slot1, bool(flag & last), bool(flag & zero), 0)
+            for position, velocity, flag in zip(positions, velocities, flags)]
+
   def unitsToInches(self, units):
     return units * self.WHEEL_CIRCUMFERENCE / self.ENCODER_COUNTS_PER_REV
 
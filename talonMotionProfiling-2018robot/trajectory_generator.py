@@ -3,6 +3,9 @@ import pathfinder as pf
 import pickle
 import math
 import csv
+import argparse
+
+import trajectoryfile
 
 # Pathfinder constants
 MAX_VELOCITY = 4  # ft/s
@@ -10,6 +13,19 @@ MAX_ACCELERATION = 4 #ft/s/s
 PERIOD = 0.02
 MAX_JERK = 120.0
 
+# Robot constants the compiled trajectory is converted for, the same as MyRobot
+WHEELBASE = 2.1 # ft
+ENCODER_COUNTS_PER_REV = 4096
+WHEEL_DIAMETER = 6 # inches
+
+parser = argparse.ArgumentParser(description="Generate the trajectory and compile it for the Talons")
+parser.add_argument("--output", default="/home/ubuntu/traj.bin", help="compiled trajectory file")
+parser.add_argument("--pickle", default="/home/ubuntu/traj", help="pickled pathfinder segments, for older code")
+parser.add_argument("--wheelbase", type=float, default=WHEELBASE)
+parser.add_argument("--counts-per-rev", type=int, default=ENCODER_COUNTS_PER_REV)
+parser.add_argument("--wheel-diameter", type=float, default=WHEEL_DIAMETER)
+args = parser.parse_args()
+
 # Set up the trajectory
 points = [pf.Waypoint(0, 0, 0), pf.Waypoint(6, 3, math.pi/2), pf.Waypoint(0, 6, 0)]
 
@@ -32,5 +48,13 @@ with open('/home/ubuntu/out.csv', 'w+') as points:
         points_writer.writerow([i.dt, i.x, i.y, i.position, i.velocity, i.acceleration, i.jerk, i.heading])
 '''
 
-with open("/home/ubuntu/traj", "wb") as fp:
-    pickle.dump(trajectory, fp)
+if args.pickle:
+    with open(args.pickle, "wb") as fp:
+        pickle.dump(trajectory, fp)
+
+# The TankModifier and the unit conversions are done here instead of in autonomousInit
+modifier = pf.modifiers.TankModifier(trajectory).modify(args.wheelbase)
+units_per_foot = trajectoryfile.units_per_foot(args.counts_per_rev, args.wheel_diameter)
+columns = trajectoryfile.compile_tank(modifier.getLeftTrajectory(), modifier.getRightTrajectory(), units_per_foot)
+trajectoryfile.write_trajectory(args.output, columns, PERIOD, units_per_foot)
+print("Wrote %d points to %s" % (len(trajectory), args.output))
@@ -0,0 +1,192 @@
+'''
+Compiled tank trajectories, ready to push into the Talons.
+
+trajectory_generator.py does the TankModifier and the unit conversions
+offline and writes the result with write_trajectory().  The robot opens the
+file with TrajectoryFile, which maps it into memory and hands the columns
+out as memoryviews of doubles, so nothing is unpickled or converted at the
+start of auto.
+
+Layout, all little endian:
+
+  header   HEADER struct, see below
+  columns  COLUMNS, each one count float64s, one column after the other
+  flags    count bytes, FLAG_ZERO_POSITION and FLAG_LAST_POINT
+
+Positions are in encoder units, velocities in encoder units per 100ms and the
+heading in tenths of a degree (the pigeon's aux units).  units_per_foot is
+what the file was compiled for, so a robot with different wheels or encoders
+can refuse it.  crc32 covers everything after the header.
+
+Only uses the standard library, the same file is in DeepSpace2019 and
+talonMotionProfiling-2018robot.
+'''
+import math
+import mmap
+import operator
+import os
+import struct
+import zlib
+
+MAGIC = b'TRJ1'
+VERSION = 1
+
+'''magic, version, column count, point count, period (s), units per foot, crc32'''
+HEADER = struct.Struct('<4sHHIddI')
+
+COLUMNS = ('left_position', 'left_velocity', 'right_position', 'right_velocity', 'heading')
+
+FLAG_ZERO_POSITION = 1
+FLAG_LAST_POINT = 2
+
+class TrajectoryFormatError(Exception):
+  pass
+
+def units_per_foot(encoder_counts_per_rev, wheel_diameter_inches):
+  return 12 * encoder_counts_per_rev / (math.pi * wheel_diameter_inches)
+
+def compile_tank(left_segments, right_segments, units_per_foot):
+  '''
+  Left and right wheel segments in feet (pathfinder Segments or anything
+  with position, velocity and heading) to a dict of Talon unit columns
+  '''
+  columns = {name: [] for name in COLUMNS}
+  for left, right in zip(left_segments, right_segments):
+    columns['left_position'].append(left.position * units_per_foot)
+    columns['left_velocity'].append(left.velocity * units_per_foot / 10)
+    columns['right_position'].append(right.position * units_per_foot)
+    columns['right_velocity'].append(right.velocity * units_per_foot / 10)
+    columns['heading'].append(10 * math.degrees(left.heading))
+  return columns
+
+def write_trajectory(path, columns, period, units_per_foot):
+  count = len(columns[COLUMNS[0]])
+  for name in COLUMNS:
+    if len(columns[name]) != count:
+      raise ValueError('column %s has %d points, expected %d' % (name, len(columns[name]), count))
+
+  flags = bytearray(count)
+  if count:
+    flags[0] |= FLAG_ZERO_POSITION
+    flags[-1] |= FLAG_LAST_POINT
+
+  data = b''.join(struct.pack('<%dd' % count, *columns[name]) for name in COLUMNS) + bytes(flags)
+  header = HEADER.pack(MAGIC, VERSION, len(COLUMNS), count, period, units_per_foot, zlib.crc32(data) & 0xffffffff)
+
+  '''Write a new file and move it over the old one, the robot never sees half a file'''
+  with open(path + '.tmp', 'wb') as fp:
+    fp.write(header)
+    fp.write(data)
+  os.replace(path + '.tmp', path)
+
+class TrajectoryFile():
+  '''
+  A compiled trajectory mapped into memory.  Every name in COLUMNS is an
+  attribute holding a memoryview of doubles, flags is a memoryview of bytes.
+  '''
+
+  def __init__(self, path, units_per_foot=None):
+    self.fp = open(path, 'rb')
+    try:
+      self.map = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+      self.fp.close()
+      raise TrajectoryFormatError('%s is empty' % path)
+
+    try:
+      self.load(path, units_per_foot)
+    except Exception:
+      self.close()
+      raise
+
+  def load(self, path, expected_units_per_foot):
+    if len(self.map) < HEADER.size:
+      raise TrajectoryFormatError('%s is too short for a header' % path)
+    magic, version, columns, count, period, units_per_foot, crc = HEADER.unpack_from(self.map, 0)
+    if magic != MAGIC:
+      raise TrajectoryFormatError('%s is not a compiled trajectory' % path)
+    if version != VERSION or columns != len(COLUMNS):
+      raise TrajectoryFormatError('%s is version %d with %d columns, expected %d with %d' % (path, version, columns, VERSION, len(COLUMNS)))
+    if expected_units_per_foot is not None and not math.isclose(units_per_foot, expected_units_per_foot, rel_tol=1e-9):
+      raise TrajectoryFormatError('%s was compiled for %f units per foot, this robot has %f' % (path, units_per_foot, expected_units_per_foot))
+
+    size = count * (8 * len(COLUMNS) + 1)
+    if len(self.map) != HEADER.size + size:
+      raise TrajectoryFormatError('%s should be %d bytes, it is %d' % (path, HEADER.size + size, len(self.map)))
+
+    view = memoryview(self.map)[HEADER.size:]
+    if zlib.crc32(view) & 0xffffffff != crc:
+      view.release()
+      raise TrajectoryFormatError('%s failed its checksum' % path)
+
+    self.count = count
+    self.period = period
+    self.units_per_foot = units_per_foot
+    self.views = [view]
+    for i, name in enumerate(COLUMNS):
+      column = view[8 * count * i:8 * count * (i + 1)].cast('d')
+      self.views.append(column)
+      setattr(self, name, column)
+    self.flags = view[8 * count * len(COLUMNS):]
+    self.views.append(self.flags)
+
+  def __len__(self):
+    return self.count
+
+  def close(self):
+    '''The memoryviews have to go before the map can be closed'''
+    for view in reversed(getattr(self, 'views', [])):
+      view.release()
+    self.views = []
+    self.map.close()
+    self.fp.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+class NegatedColumn():
+  '''A column read back with its sign flipped, without copying it'''
+
+  def __init__(self, column):
+    self.column = column
+
+  def __len__(self):
+    return len(self.column)
+
+  def __getitem__(self, index):
+    return -self.column[index]
+
+  def __iter__(self):
+    return map(operator.neg, self.column)
+
+class MirroredTrajectory():
+  '''
+  A trajectory reflected across the x axis (y and every angle negated), the
+  other side's version of the same route.  The left wheel takes the right
+  wheel's path and the other way round, and the heading turns the other
+  way, so nothing has to be generated again.  Reads through to the original
+  columns, which have to stay open.
+  '''
+
+  def __init__(self, trajectory):
+    self.trajectory = trajectory
+    self.count = trajectory.count
+    self.period = trajectory.period
+    self.units_per_foot = trajectory.units_per_foot
+    self.left_position = trajectory.right_position
+    self.left_velocity = trajectory.right_velocity
+    self.right_position = trajectory.left_position
+    self.right_velocity = trajectory.left_velocity
+    self.heading = NegatedColumn(trajectory.heading)
+    self.flags = trajectory.flags
+
+  def __len__(self):
+    return self.count
+
+def mirror(trajectory):
+  if isinstance(trajectory, MirroredTrajectory):
+    return trajectory.trajectory
+  return MirroredTrajectory(trajectory)
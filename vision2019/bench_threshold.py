@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+#
+# Compares the cvtColor + inRange threshold with the lookup table threshold
+# at the camera resolutions we use.  Run it on the Pi, the answer there is
+# not the same as on a laptop.
+#
+#   python3 bench_threshold.py [image ...]
+#
+# Without any images it uses a synthetic frame with a couple of green
+# targets on a noisy background.
+#
+
+import sys
+import timeit
+
+import numpy
+import cv2
+
+from bufferpool import BufferPool
+from threshold import HsvThreshold, LutThreshold
+
+# Same limits as H_LOW..V_HIGH in vision.py
+LOW_HSV = (50, 98, 73)
+HIGH_HSV = (90, 244, 136)
+
+RESOLUTIONS = [(320, 240), (640, 480)]
+REPEAT = 5
+NUMBER = 50
+
+def synthetic_frame(width, height):
+    rng = numpy.random.RandomState(63)
+    img = rng.randint(0, 256, size=(height, width, 3)).astype(numpy.uint8)
+    cv2.rectangle(img, (width // 4, height // 3), (width // 4 + width // 20, height // 3 + height // 6), (60, 200, 40), -1)
+    cv2.rectangle(img, (width // 2, height // 3), (width // 2 + width // 20, height // 3 + height // 6), (60, 200, 40), -1)
+    return img
+
+def time_threshold(thresholder, img):
+    workspace = thresholder.make_workspace(img.shape, BufferPool())
+    dst = numpy.empty(shape=img.shape[:2], dtype=numpy.uint8)
+    best = min(timeit.repeat(lambda: thresholder.apply(img, dst, workspace), number=NUMBER, repeat=REPEAT))
+    return best / NUMBER * 1000.0, dst
+
+def main():
+    engines = [("hsv", HsvThreshold(LOW_HSV, HIGH_HSV)),
+               ("lut 2^15", LutThreshold(LOW_HSV, HIGH_HSV, bits=5)),
+               ("lut 2^18", LutThreshold(LOW_HSV, HIGH_HSV, bits=6))]
+
+    sources = [cv2.imread(path) for path in sys.argv[1:]] or [None]
+
+    print("{:>9} {:>10} {:>10} {:>10}".format("size", "engine", "ms/frame", "agree %"))
+    for width, height in RESOLUTIONS:
+        for source in sources:
+            if source is None:
+                img = synthetic_frame(width, height)
+            else:
+                img = cv2.resize(source, (width, height))
+
+            reference = None
+            for name, thresholder in engines:
+                ms, mask = time_threshold(thresholder, img)
+                if reference is None:
+                    reference = mask.copy()
+                agree = 100.0 * numpy.count_nonzero(mask == reference) / mask.size
+                print("{:>9} {:>10} {:>10.3f} {:>10.3f}".format("{}x{}".format(width, height), name, ms, agree))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#----------------------------------------------------------------------------
+# Reusable image buffers for the vision pipeline.
+#
+# Every stage gets its images from one pool keyed by (shape, dtype) instead
+# of allocating them, so once the pipeline has warmed up no new image
+# memory is allocated and the garbage collector has nothing to do.
+#
+# In debug mode end_frame() also checks that this holds and raises
+# AllocationError after the warmup frames if a frame needed a new pool
+# buffer, or if the memory blocks Python has allocated keep growing.  That
+# is sys.getallocatedblocks(), which counts numpy array objects, contour
+# lists and results as well as everything else.  Temporaries freed within
+# the frame and frames in flight on other threads don't count: the lowest
+# count of every window_frames frames has to stay within max_growth blocks
+# (free lists move it a little) of the first window's.
+#----------------------------------------------------------------------------
+
+import collections
+import sys
+import threading
+
+import numpy
+
+class AllocationError(RuntimeError):
+    pass
+
+class BufferPool():
+    def __init__(self, debug=False, warmup_frames=100, window_frames=30, max_growth=256):
+        self.debug = debug
+        self.warmup_frames = warmup_frames
+        self.window_frames = window_frames
+        self.max_growth = max_growth
+
+        self._lock = threading.Lock()
+        self._free = collections.defaultdict(list)
+
+        self.allocations = 0
+        self.frames = 0
+        self._frame_allocations = 0
+        self._window_blocks = None
+        self._steady_blocks = None
+
+    def acquire(self, shape, dtype=numpy.uint8):
+        """Return a buffer of the given shape and dtype, contents undefined."""
+        key = (tuple(shape), numpy.dtype(dtype))
+        with self._lock:
+            free = self._free[key]
+            if free:
+                return free.pop()
+            self.allocations += 1
+            self._frame_allocations += 1
+        return numpy.empty(shape=key[0], dtype=key[1])
+
+    def release(self, buffer):
+        """Give a buffer back to the pool, it must not be used afterwards."""
+        key = (buffer.shape, buffer.dtype)
+        with self._lock:
+            self._free[key].append(buffer)
+
+    def end_frame(self):
+        """Call once per frame, returns the buffers allocated during it."""
+        with self._lock:
+            allocated = self._frame_allocations
+            self._frame_allocations = 0
+            self.frames += 1
+            frames = self.frames
+
+        if not self.debug or frames <= self.warmup_frames:
+            return allocated
+        if allocated > 0:
+            raise AllocationError("{} buffer(s) allocated in steady state at frame {}".format(allocated, frames))
+
+        # Frames still being processed on other threads come and go, what is
+        # left at the quietest moment of each window is what stays allocated
+        blocks = sys.getallocatedblocks()
+        if self._window_blocks is None or blocks < self._window_blocks:
+            self._window_blocks = blocks
+        if frames % self.window_frames:
+            return allocated
+
+        lowest = self._window_blocks
+        self._window_blocks = None
+        if self._steady_blocks is None:
+            self._steady_blocks = lowest
+        elif lowest - self._steady_blocks > self.max_growth:
+            raise AllocationError("{} memory blocks allocated and not freed between frame {} and {}".format(
+                lowest - self._steady_blocks, self.warmup_frames, frames))
+        return allocated
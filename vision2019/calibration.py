@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+#----------------------------------------------------------------------------
+# Startup calibration of the target camera exposure and HSV threshold.
+#
+# The operator points the camera at a target and selects the region it is
+# in ("calibration_roi" = [x, y, w, h] on the vision table).  For every
+# exposure / brightness pair in the sweep one frame is grabbed, the lit
+# tape pixels inside the region are separated from the rest of the region
+# with Otsu's threshold on V, and the HSV bounds are taken from the
+# per-channel histograms of those pixels.  Each candidate is scored on how
+# much of the tape its mask keeps against how many pixels outside the
+# region it lets through, and the best one is written to the calibration
+# file together with the camera settings that produced it.
+#
+# The sweep stops when the time budget runs out and keeps the best result
+# so far, so startup never takes longer than the budget.
+#
+# It also runs on a saved image, to check a region by hand:
+#
+#   python3 calibration.py <image> <x> <y> <w> <h> [-o calibration.json]
+#----------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy
+import cv2
+
+# Exposure (absolute) and brightness (percent) values to try, darkest first.
+# With the ring light on, the tape stays bright long after the rest of the
+# field has gone dark.
+EXPOSURES = (2, 5, 10, 20, 40)
+BRIGHTNESSES = (10, 30, 50)
+
+# Frames thrown away after changing a setting while the camera catches up
+SETTLE_FRAMES = 3
+
+# Fraction of the tape pixels the bounds must keep, split over both ends
+COVERAGE = 0.98
+
+# Added around the histogram bounds so small lighting changes still pass
+MARGIN = (3, 10, 10)
+
+# Regions with fewer lit pixels than this can't be calibrated from
+MIN_TARGET_PIXELS = 20
+
+# Bounds scoring below this don't separate the target from the background
+MIN_SCORE = 0.5
+
+class CalibrationResult():
+    __slots__ = ("low", "high", "exposure", "brightness", "recall", "false_positive", "score")
+
+    def __init__(self, low, high, recall, false_positive, exposure=None, brightness=None):
+        self.low = low
+        self.high = high
+        self.recall = recall
+        self.false_positive = false_positive
+        self.score = recall - false_positive
+        self.exposure = exposure
+        self.brightness = brightness
+
+    def to_json(self):
+        return {"hsv_low": list(self.low),
+                "hsv_high": list(self.high),
+                "exposure": self.exposure,
+                "brightness": self.brightness,
+                "recall": round(float(self.recall), 4),
+                "false_positive": round(float(self.false_positive), 4)}
+
+"""Clamp an (x, y, w, h) region to the image, None if nothing is left."""
+def clamp_roi(roi, width, height):
+    x, y, w, h = (int(v) for v in roi)
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(width, x + w), min(height, y + h)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+"""
+Lowest and highest value that keep `coverage` of the pixels, read off the
+cumulative histogram of one 8 bit channel.
+"""
+def histogram_bounds(values, coverage=COVERAGE):
+    cumulative = numpy.cumsum(numpy.bincount(values, minlength=256))
+    tail = (1.0 - coverage) / 2.0 * cumulative[-1]
+    low = int(numpy.searchsorted(cumulative, tail, side="right"))
+    high = int(numpy.searchsorted(cumulative, cumulative[-1] - tail, side="left"))
+    return low, high
+
+"""The lit tape pixels of the region, as an (N, 3) array of HSV values."""
+def target_pixels(hsv, roi):
+    x, y, w, h = roi
+    region = hsv[y:y + h, x:x + w]
+
+    # The tape is much brighter than its surroundings, let Otsu pick the split
+    _, lit = cv2.threshold(numpy.ascontiguousarray(region[:, :, 2]), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return region[lit > 0]
+
+"""Tightest HSV bounds around the target pixels, or None."""
+def hsv_bounds(pixels, coverage=COVERAGE, margin=MARGIN):
+    if len(pixels) < MIN_TARGET_PIXELS:
+        return None
+
+    low = []
+    high = []
+    # OpenCV hue only goes up to 179
+    for channel, top in enumerate((179, 255, 255)):
+        channel_low, channel_high = histogram_bounds(pixels[:, channel], coverage)
+        low.append(max(0, channel_low - margin[channel]))
+        high.append(min(top, channel_high + margin[channel]))
+    return tuple(low), tuple(high)
+
+"""
+Score bounds on one frame.  recall is the fraction of the tape pixels the
+mask keeps, false_positive is the number of pixels outside the region the
+mask lets through, relative to the number of tape pixels.
+"""
+def score_bounds(hsv, roi, pixels, low, high):
+    mask = cv2.inRange(hsv, numpy.array(low, dtype=numpy.uint8), numpy.array(high, dtype=numpy.uint8))
+
+    x, y, w, h = roi
+    inside = numpy.count_nonzero(mask[y:y + h, x:x + w])
+    outside = numpy.count_nonzero(mask) - inside
+
+    kept = numpy.count_nonzero(numpy.all((pixels >= low) & (pixels <= high), axis=1))
+    return kept / float(len(pixels)), outside / float(len(pixels))
+
+"""Calibrate the threshold from one BGR frame, None if the region has no target."""
+def evaluate(img, roi):
+    roi = clamp_roi(roi, img.shape[1], img.shape[0])
+    if roi is None:
+        return None
+
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    pixels = target_pixels(hsv, roi)
+    bounds = hsv_bounds(pixels)
+    if bounds is None:
+        return None
+
+    low, high = bounds
+    recall, false_positive = score_bounds(hsv, roi, pixels, low, high)
+    result = CalibrationResult(low, high, recall, false_positive)
+    if result.score < MIN_SCORE:
+        return None
+    return result
+
+"""
+Try every exposure / brightness pair on the camera and return the best
+CalibrationResult, or None.  Stops as soon as `budget` seconds are used up.
+The camera is left on the best settings found.
+"""
+def sweep(camera, sink, frame_shape, roi, budget, exposures=EXPOSURES, brightnesses=BRIGHTNESSES,
+          settle_frames=SETTLE_FRAMES, clock=time.monotonic):
+    deadline = clock() + budget
+    img = numpy.zeros(shape=frame_shape, dtype=numpy.uint8)
+    best = None
+
+    for exposure in exposures:
+        for brightness in brightnesses:
+            if clock() >= deadline:
+                break
+
+            camera.setExposureManual(exposure)
+            camera.setBrightness(brightness)
+
+            # A stalled camera must not hold the sweep past the deadline,
+            # every grab only waits for what is left of the budget
+            grabbed = 0
+            for _ in range(settle_frames + 1):
+                remaining = deadline - clock()
+                if remaining <= 0:
+                    grabbed = 0
+                    break
+                grabbed, img = sink.grabFrame(img, remaining)
+            if grabbed == 0:
+                continue
+
+            result = evaluate(img, roi)
+            if result is None:
+                continue
+
+            result.exposure = exposure
+            result.brightness = brightness
+            if best is None or result.score > best.score:
+                best = result
+
+    if best is not None:
+        apply_camera_settings(camera, best.to_json())
+    return best
+
+"""Put the saved exposure and brightness back on the camera."""
+def apply_camera_settings(camera, calibration):
+    if calibration.get("exposure") is not None:
+        camera.setExposureManual(int(calibration["exposure"]))
+    if calibration.get("brightness") is not None:
+        camera.setBrightness(int(calibration["brightness"]))
+
+"""Read the calibration file, None if there isn't a usable one."""
+def load_calibration(path):
+    try:
+        with open(path, "rt") as f:
+            calibration = json.load(f)
+    except (OSError, ValueError) as err:
+        print("could not read calibration '{}': {}".format(path, err), file=sys.stderr)
+        return None
+
+    if len(calibration.get("hsv_low", ())) != 3 or len(calibration.get("hsv_high", ())) != 3:
+        print("calibration '{}' has no HSV bounds".format(path), file=sys.stderr)
+        return None
+    return calibration
+
+def save_calibration(path, result):
+    # Write then rename, a reboot half way through can't leave a broken file
+    tmp = path + ".tmp"
+    with open(tmp, "wt") as f:
+        json.dump(result.to_json(), f, indent=4)
+    os.replace(tmp, path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the HSV threshold from a saved frame")
+    parser.add_argument("image")
+    parser.add_argument("roi", type=int, nargs=4, metavar=("X", "Y", "W", "H"), help="target region")
+    parser.add_argument("-o", "--output", help="write the result to this calibration file")
+    args = parser.parse_args()
+
+    img = cv2.imread(args.image)
+    if img is None:
+        print("could not read '{}'".format(args.image), file=sys.stderr)
+        sys.exit(1)
+
+    result = evaluate(img, args.roi)
+    if result is None:
+        print("no target found in the region", file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps(result.to_json()))
+    if args.output:
+        save_calibration(args.output, result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#----------------------------------------------------------------------------
+# Vision to robot clock synchronization over NetworkTables.
+#
+# The coprocessor writes [seq, send_time] to "clock_ping", the robot answers
+# on "clock_pong" with [seq, send_time, fpga_time].  Assuming the request
+# and the answer take about the same time on the wire, the robot read its
+# clock half way through the round trip, so
+#
+#     offset = fpga_time - (send_time + receive_time) / 2
+#
+# NetworkTables batches updates, so most round trips are slow and lopsided.
+# Only the fastest round trips in the window are trusted and the offset is
+# smoothed on top of that.
+#----------------------------------------------------------------------------
+
+import collections
+import threading
+import time
+
+from networktables import NetworkTables
+
+class ClockOffsetEstimator():
+    def __init__(self, table, clock=time.time, period=0.25, window=20, best=4, smoothing=0.2):
+        self.table = table
+        self.clock = clock
+        self.period = period
+        self.best = best
+        self.smoothing = smoothing
+
+        self._lock = threading.Lock()
+        self._samples = collections.deque(maxlen=window)
+        self._pending = {}
+        self._seq = 0
+        self._thread = None
+
+        self.offset = None
+        self.rtt = None
+
+    def start(self):
+        self.table.addEntryListener(self._pong, key="clock_pong")
+        self._thread = threading.Thread(target=self._ping_loop, name="vision-clock", daemon=True)
+        self._thread.start()
+
+    def synchronized(self):
+        return self.offset is not None
+
+    def to_robot_time(self, local_time):
+        """Convert a local clock reading to robot FPGA time, None until synchronized."""
+        offset = self.offset
+        if offset is None:
+            return None
+        return local_time + offset
+
+    def _ping_loop(self):
+        while True:
+            with self._lock:
+                self._seq += 1
+                seq = self._seq
+                send_time = self.clock()
+                self._pending[seq] = send_time
+                # Forget pings the robot never answered
+                for old in [s for s in self._pending if s < seq - 10]:
+                    del self._pending[old]
+
+            self.table.putNumberArray("clock_ping", (seq, send_time))
+            NetworkTables.flush()
+            time.sleep(self.period)
+
+    def _pong(self, table, key, value, isNew):
+        receive_time = self.clock()
+        if len(value) < 3:
+            return
+
+        seq, send_time, robot_time = int(value[0]), value[1], value[2]
+        with self._lock:
+            # Ignore stale or duplicate answers
+            if self._pending.pop(seq, None) != send_time:
+                return
+
+            rtt = receive_time - send_time
+            self._samples.append((rtt, robot_time - (send_time + receive_time) / 2))
+
+            fastest = sorted(self._samples)[:self.best]
+            estimate = sum(offset for _, offset in fastest) / len(fastest)
+
+            if self.offset is None:
+                self.offset = estimate
+            else:
+                self.offset += self.smoothing * (estimate - self.offset)
+            self.rtt = fastest[0][0]
+
+        self.table.putNumber("clock_offset", self.offset)
+        self.table.putNumber("clock_rtt_ms", self.rtt * 1000.0)
@@ -0,0 +1,151 @@
+#----------------------------------------------------------------------------
+# Downscaled, annotated camera stream for the driver station dashboard.
+#
+# The detection loop only ever calls offer(), which resizes every skip-th
+# frame into a small spare buffer and returns.  Drawing the overlay and
+# handing the frame to cscore happen on the stream thread.  If that thread
+# is still busy with the previous frame, the new one replaces it instead
+# of waiting.
+#
+# The MJPEG server re-encodes every frame per client, at the quality set
+# with setDefaultCompression().  To report bandwidth against the FMS cap,
+# one frame per stats period is also JPEG encoded here at the same quality.
+# That gives the encode time and bytes per frame, and bandwidth is bytes
+# per frame times the streamed frame rate.
+#----------------------------------------------------------------------------
+
+import threading
+import time
+
+import numpy
+import cv2
+
+from bufferpool import BufferPool
+
+PAIR_COLOR = (0, 255, 0)
+STRIP_COLOR = (0, 0, 255)
+TEXT_COLOR = (255, 255, 255)
+
+class DashboardStream():
+    def __init__(self, output, width, height, quality=30, skip=2, stats_period=1.0, pool=None):
+        self.output = output
+        self.width = width
+        self.height = height
+        self.quality = quality
+        # Stream one frame out of every `skip`
+        self.skip = max(1, skip)
+        self.stats_period = stats_period
+        self.pool = pool if pool is not None else BufferPool()
+
+        # Three small frames: one being filled by offer(), one waiting for
+        # the stream thread and one being drawn on and streamed
+        shape = (height, width, 3)
+        self._free = [self.pool.acquire(shape) for _ in range(3)]
+        self._pending = None
+        self._pending_annotation = None
+        self._streaming = None
+
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._offered = 0
+
+        self.streamed = 0
+        self.replaced = 0
+        self.encode_ms = 0.0
+        self.frame_bytes = 0
+        self._last_sample = 0.0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._stream_loop, name="vision-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+
+    def offer(self, img, result=None):
+        """Called by the detection loop, never waits on the stream thread."""
+        self._offered += 1
+        if self._offered % self.skip:
+            return
+
+        with self._cond:
+            if not self._free:
+                # Another thread is filling the only free frame
+                self.replaced += 1
+                return
+            small = self._free.pop()
+
+        cv2.resize(img, (self.width, self.height), dst=small, interpolation=cv2.INTER_NEAREST)
+        scale = (self.width / float(img.shape[1]), self.height / float(img.shape[0]))
+
+        with self._cond:
+            if self._pending is not None:
+                # The stream thread hasn't taken the last one, skip it
+                self._free.append(self._pending)
+                self.replaced += 1
+            self._pending = small
+            self._pending_annotation = (result, scale)
+            self._cond.notify()
+
+    def bandwidth(self, fps):
+        """Estimated stream bandwidth in megabits per second at the given frame rate."""
+        return self.frame_bytes * 8.0 * fps / 1e6
+
+    def _take(self):
+        with self._cond:
+            while self._running and self._pending is None:
+                self._cond.wait()
+            if not self._running:
+                return None, None
+
+            # cscore has copied the last frame by now, it can be reused
+            if self._streaming is not None:
+                self._free.append(self._streaming)
+            self._streaming = self._pending
+            annotation = self._pending_annotation
+            self._pending = None
+            self._pending_annotation = None
+            return self._streaming, annotation
+
+    def _stream_loop(self):
+        while True:
+            img, annotation = self._take()
+            if img is None:
+                return
+
+            result, scale = annotation
+            if result is not None:
+                draw_overlay(img, result, scale)
+
+            now = time.monotonic()
+            if now - self._last_sample >= self.stats_period:
+                self._last_sample = now
+                self._sample_encode(img)
+
+            self.output.putFrame(img)
+            self.streamed += 1
+
+    def _sample_encode(self, img):
+        start = time.perf_counter()
+        ok, jpeg = cv2.imencode(".jpg", img, (cv2.IMWRITE_JPEG_QUALITY, self.quality))
+        if ok:
+            self.encode_ms = (time.perf_counter() - start) * 1000.0
+            self.frame_bytes = len(jpeg)
+
+"""Draw the strips and target solution onto a downscaled frame."""
+def draw_overlay(img, result, scale):
+    sx, sy = scale
+    pair = result.pair or ()
+    for strip in result.strips:
+        corners = numpy.int32(strip.corners * (sx, sy))
+        color = PAIR_COLOR if strip in pair else STRIP_COLOR
+        cv2.polylines(img, (corners,), True, color, 1)
+
+    if result.valid:
+        text = "{:.1f} deg {:.0f} in".format(result.yaw, result.distance)
+        cv2.putText(img, text, (4, img.shape[0] - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.4, TEXT_COLOR, 1)
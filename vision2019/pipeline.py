@@ -0,0 +1,259 @@
+#----------------------------------------------------------------------------
+# Threaded capture / process / publish pipeline for the vision coprocessor.
+#
+# The serial loop in vision.py can only run as fast as the slowest of
+# grabFrame, the OpenCV processing and putFrame added together.  Here each
+# stage runs on its own thread(s) and the stages are joined by small ring
+# buffers that throw away the oldest frame when they are full, so a slow
+# stage drops stale frames instead of slowing the camera down.  The OpenCV
+# calls release the GIL, so a couple of processing threads really do run in
+# parallel on the Pi's cores.
+#----------------------------------------------------------------------------
+
+import collections
+import heapq
+import queue
+import threading
+import time
+
+from bufferpool import BufferPool
+
+class RingBuffer():
+    """Bounded FIFO queue that drops the oldest item when it is full."""
+
+    def __init__(self, capacity, on_drop=None):
+        self.capacity = capacity
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        dropped = None
+        with self._cond:
+            if len(self._items) >= self.capacity:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+        # Hand the dropped item back outside of the lock
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    def get(self, timeout=None):
+        """Return the oldest item, or None on timeout or once closed."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def drain(self):
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+        return items
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+class StageStats():
+    """Rolling latency statistics (milliseconds) for one pipeline stage."""
+
+    def __init__(self, name, window=120):
+        self.name = name
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds * 1000.0)
+            self.count += 1
+
+    def summary(self):
+        with self._lock:
+            if not self._samples:
+                return 0.0, 0.0
+            return sum(self._samples) / len(self._samples), max(self._samples)
+
+class Frame():
+    __slots__ = ("seq", "capture_time", "img", "grabbed", "started", "processed", "result")
+
+    def __init__(self, img):
+        self.img = img
+        self.seq = 0
+        self.capture_time = 0
+        self.grabbed = 0.0
+        self.started = 0.0
+        self.processed = 0.0
+        self.result = None
+
+    def sort_key(self):
+        return (self.capture_time, self.seq)
+
+class VisionPipeline():
+    """
+    Three stage grab -> process -> publish pipeline.
+
+    grab(img) fills img in place and returns (capture_time, img), with a
+    capture time of 0 on error, exactly like CvSink.grabFrame().
+    make_workspace() builds the per-thread scratch buffers, and
+    process(img, workspace) returns the result for one frame.  Both run on
+    the processing threads.  publish(frame) runs on the publish thread with
+    frames in capture time order.
+    """
+
+    STAGES = ("grab", "queue", "process", "publish", "total")
+
+    def __init__(self, grab, process, publish, frame_shape, make_workspace=lambda: None,
+                 workers=2, depth=2, pool=None):
+        self.grab = grab
+        self.process = process
+        self.publish = publish
+        self.make_workspace = make_workspace
+        self.workers = workers
+        self.pool = pool if pool is not None else BufferPool()
+
+        self.stats = {name: StageStats(name) for name in self.STAGES}
+
+        # Every frame buffer the pipeline can hold at once: one being grabbed,
+        # both ring buffers full, one per worker, worst case reorder backlog
+        # and the one being published.
+        self._free = queue.Queue()
+        for _ in range(2 + 2 * depth + 2 * workers):
+            self._free.put(Frame(self.pool.acquire(frame_shape)))
+
+        self._to_process = RingBuffer(depth, on_drop=self._release)
+        self._to_publish = RingBuffer(depth, on_drop=self._release)
+
+        # Ordering state, all protected by _order_lock
+        self._order_lock = threading.Lock()
+        self._in_flight = set()
+        self._reorder = []
+        self._last_published = (-1, -1)
+        self.out_of_order = 0
+
+        self._seq = 0
+        self._running = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._running.set()
+        self._threads = [threading.Thread(target=self._grab_loop, name="vision-grab", daemon=True),
+                         threading.Thread(target=self._publish_loop, name="vision-publish", daemon=True)]
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._process_loop, name="vision-process-{}".format(i), daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._running.clear()
+        self._to_process.close()
+        self._to_publish.close()
+        for thread in self._threads:
+            thread.join()
+
+    def is_alive(self):
+        """False as soon as any stage has died, the pipeline can't recover from that."""
+        return all(thread.is_alive() for thread in self._threads)
+
+    def report(self):
+        """Return {stage: (mean_ms, max_ms)} plus drop counters."""
+        report = {name: stats.summary() for name, stats in self.stats.items()}
+        report["dropped_process"] = self._to_process.dropped
+        report["dropped_publish"] = self._to_publish.dropped
+        report["out_of_order"] = self.out_of_order
+        report["published"] = self.stats["publish"].count
+        return report
+
+    def _release(self, frame):
+        frame.result = None
+        self._free.put(frame)
+
+    def _grab_loop(self):
+        while self._running.is_set():
+            frame = self._free.get()
+
+            start = time.monotonic()
+            capture_time, img = self.grab(frame.img)
+            frame.grabbed = time.monotonic()
+
+            if capture_time == 0:
+                self._release(frame)
+                continue
+
+            frame.img = img
+            frame.capture_time = capture_time
+            frame.seq = self._seq
+            self._seq += 1
+            self.stats["grab"].record(frame.grabbed - start)
+
+            self._to_process.put(frame)
+
+    def _process_loop(self):
+        workspace = self.make_workspace()
+        while self._running.is_set():
+            frame = self._to_process.get(timeout=0.1)
+            if frame is None:
+                continue
+
+            with self._order_lock:
+                self._in_flight.add(frame.sort_key())
+
+            frame.started = time.monotonic()
+            self.stats["queue"].record(frame.started - frame.grabbed)
+            frame.result = self.process(frame.img, workspace)
+            frame.processed = time.monotonic()
+            self.stats["process"].record(frame.processed - frame.started)
+
+            self._finish(frame)
+
+    def _finish(self, frame):
+        """Hand frames to the publisher in capture order."""
+        ready = []
+        stale = []
+        with self._order_lock:
+            self._in_flight.discard(frame.sort_key())
+            heapq.heappush(self._reorder, (frame.sort_key(), frame))
+
+            # A frame can be released once nothing older is still being processed
+            oldest_in_flight = min(self._in_flight) if self._in_flight else None
+            while self._reorder and (oldest_in_flight is None or self._reorder[0][0] < oldest_in_flight):
+                key, ready_frame = heapq.heappop(self._reorder)
+                if key < self._last_published:
+                    # A worker picked this up after a newer frame was already released
+                    stale.append(ready_frame)
+                    self.out_of_order += 1
+                else:
+                    self._last_published = key
+                    ready.append(ready_frame)
+
+        for ready_frame in ready:
+            self._to_publish.put(ready_frame)
+        for stale_frame in stale:
+            self._release(stale_frame)
+
+    def _publish_loop(self):
+        while self._running.is_set():
+            frame = self._to_publish.get(timeout=0.1)
+            if frame is None:
+                continue
+
+            start = time.monotonic()
+            self.publish(frame)
+            finish = time.monotonic()
+            self.stats["publish"].record(finish - start)
+            self.stats["total"].record(finish - frame.grabbed)
+
+            self._release(frame)
+            self.pool.end_frame()
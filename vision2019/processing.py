@@ -0,0 +1,126 @@
+#----------------------------------------------------------------------------
+# Per-frame processing for the target camera.
+#
+# Nothing in here touches a camera, CameraServer or a NetworkTables server,
+# so the exact code that runs on the Pi can also be run on recorded frames
+# on a laptop (see replay.py).
+#----------------------------------------------------------------------------
+
+import time
+
+import numpy
+import cv2
+
+from bufferpool import BufferPool
+from roi import RoiTracker
+from threshold import HsvThreshold, LutThreshold
+from targetsolver import CameraIntrinsics, TargetSolver
+
+# Capture timestamps further than this from our own clock are not trusted
+MAX_CAPTURE_AGE = 1.0
+
+"""
+Threshold one frame and find the target contours.  Only the (x, y, w, h)
+window of img is processed, the returned contours are in full frame
+coordinates.
+"""
+def find_contours(img, thresholder, workspace, threshold_frame, window=None):
+    if window is not None:
+        x, y, w, h = window
+        # Views into the preallocated images, nothing new gets allocated
+        img = img[y:y + h, x:x + w]
+        threshold_frame = threshold_frame[:h, :w]
+        offset = (x, y)
+    else:
+        offset = (0, 0)
+
+    threshold_frame = thresholder.apply(img, threshold_frame, workspace)
+
+    # OpenCV 3 returns 3 values and OpenCV 4 returns 2, the contours are
+    # always second from the end
+    return cv2.findContours(threshold_frame, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset)[-2]
+
+"""
+Turn one BGR frame into a TargetResult.  workspace is scratch space owned by
+the calling thread, including its ROI tracker (or None), the only state
+carried from frame to frame.
+"""
+def process_frame(img, thresholder, solver, workspace):
+    threshold_workspace, threshold_frame, tracker = workspace
+
+    if tracker is None:
+        contours = find_contours(img, thresholder, threshold_workspace, threshold_frame)
+    else:
+        window = tracker.window()
+        contours = find_contours(img, thresholder, threshold_workspace, threshold_frame, window)
+        tracker.update(window, contours)
+
+    return solver.solve(contours)
+
+class FrameProcessor():
+    """
+    Bundles the threshold engine, solver and ROI tracking for one camera.
+    make_tracker() builds a tracker for each workspace, None turns tracking
+    off.
+    """
+
+    def __init__(self, frame_shape, thresholder, solver, make_tracker=None, pool=None):
+        self.frame_shape = frame_shape
+        self.thresholder = thresholder
+        self.solver = solver
+        self.make_tracker = make_tracker
+        self.pool = pool if pool is not None else BufferPool()
+
+    @classmethod
+    def create(cls, frame_shape, low_hsv, high_hsv, calibration=None, lut_bits=None,
+               roi_tracking=True, roi_max_misses=3, roi_refresh_period=30, pool=None):
+        height, width = frame_shape[:2]
+
+        if lut_bits:
+            thresholder = LutThreshold(low_hsv, high_hsv, bits=lut_bits)
+        else:
+            thresholder = HsvThreshold(low_hsv, high_hsv)
+
+        solver = TargetSolver(CameraIntrinsics.from_config(calibration, width, height), width)
+
+        if roi_tracking:
+            def make_tracker():
+                return RoiTracker(width, height, max_misses=roi_max_misses, refresh_period=roi_refresh_period)
+        else:
+            make_tracker = None
+
+        return cls(frame_shape, thresholder, solver, make_tracker, pool)
+
+    def make_workspace(self):
+        # Allocating new images is very expensive, always try to preallocate.
+        # Each processing thread tracks the ROI on its own, a shared tracker
+        # could be moved back by a thread finishing an older frame.
+        tracker = self.make_tracker() if self.make_tracker is not None else None
+        return (self.thresholder.make_workspace(self.frame_shape, self.pool),
+                self.pool.acquire(self.frame_shape[:2], numpy.uint8),
+                tracker)
+
+    def process(self, img, workspace):
+        return process_frame(img, self.thresholder, self.solver, workspace)
+
+"""
+cscore stamps frames with wpi::Now(), which is microseconds on the system
+clock.  If that ever disagrees with time.time() use the current time rather
+than publish a nonsense timestamp.
+"""
+def local_capture_time(capture_time):
+    capture = capture_time / 1e6
+    now = time.time()
+    if abs(now - capture) > MAX_CAPTURE_AGE:
+        return now
+    return capture
+
+"""
+Publish the target as one timestamped array so the robot can't read a torn
+result.  The timestamp is the capture time in robot FPGA time, or 0 while
+the clocks are not synchronized yet.
+"""
+def publish_target(nt, clock, result, capture_time):
+    timestamp = clock.to_robot_time(local_capture_time(capture_time))
+    nt.putNumberArray("target", result.record(timestamp if timestamp is not None else 0.0))
+    nt.putNumber("count_contours", result.contour_count)
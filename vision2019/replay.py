@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+#
+# Runs the vision processing on recorded frames, no camera, CameraServer or
+# NetworkTables server needed.  Use it to tune thresholds and to catch
+# performance regressions on a laptop.
+#
+#   python3 replay.py <directory of images | video file> [-o results.jsonl]
+#
+# Every frame goes through the same FrameProcessor and publish_target()
+# the Pi uses, with a stub NetworkTables table that just remembers what was
+# published.  The published record for each frame is written as one JSON
+# line, then throughput, p50/p99 latency and allocations per frame are
+# printed.
+#
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy
+import cv2
+
+from bufferpool import BufferPool, AllocationError
+from calibration import load_calibration
+from processing import FrameProcessor, publish_target
+from targetsolver import RECORD_FIELDS
+
+# Same limits as H_LOW..V_HIGH in vision.py
+LOW_HSV = (50, 98, 73)
+HIGH_HSV = (90, 244, 136)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+class StubTable():
+    """Stands in for the team63_vision_table NetworkTable."""
+
+    def __init__(self):
+        self.values = {}
+
+    def putNumber(self, key, value):
+        self.values[key] = value
+
+    def putNumberArray(self, key, value):
+        self.values[key] = list(value)
+
+class StubClock():
+    """Clock that is always synchronized with zero offset."""
+
+    def to_robot_time(self, local_time):
+        return local_time
+
+def read_frames(source, width=None, height=None):
+    """Yield (name, BGR image) for a directory of images or a video file."""
+    if os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTENSIONS))
+        frames = ((name, cv2.imread(os.path.join(source, name))) for name in names)
+    else:
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise IOError("could not open '{}'".format(source))
+
+        def video_frames():
+            index = 0
+            while True:
+                ok, img = capture.read()
+                if not ok:
+                    break
+                yield "{}#{}".format(os.path.basename(source), index), img
+                index += 1
+            capture.release()
+        frames = video_frames()
+
+    for name, img in frames:
+        if img is None:
+            print("skipping unreadable frame '{}'".format(name), file=sys.stderr)
+            continue
+        if width and height and img.shape[:2] != (height, width):
+            img = cv2.resize(img, (width, height))
+        yield name, img
+
+def percentile(samples, p):
+    return float(numpy.percentile(samples, p)) if len(samples) else 0.0
+
+def measure_allocations(processor, frames):
+    """Average peak Python/numpy bytes and net blocks allocated per frame."""
+    workspace = processor.make_workspace()
+    processor.process(frames[0][1], workspace)
+
+    tracemalloc.start()
+    peak_bytes = 0
+    blocks = sys.getallocatedblocks()
+    for _, img in frames:
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        processor.process(img, workspace)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_bytes += peak - start
+    blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+
+    return peak_bytes / len(frames), blocks / len(frames)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded frames through the vision processing")
+    parser.add_argument("source", help="directory of images or a video file")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="per-frame JSON lines output")
+    parser.add_argument("--width", type=int, help="resize frames to this width")
+    parser.add_argument("--height", type=int, help="resize frames to this height")
+    parser.add_argument("--hsv-low", type=int, nargs=3, default=LOW_HSV, metavar=("H", "S", "V"))
+    parser.add_argument("--hsv-high", type=int, nargs=3, default=HIGH_HSV, metavar=("H", "S", "V"))
+    parser.add_argument("--thresholds", help="calibration file with the HSV limits, overrides --hsv-low/--hsv-high")
+    parser.add_argument("--lut-bits", type=int, default=None, help="use the lookup table threshold (5 or 6)")
+    parser.add_argument("--no-roi", action="store_true", help="always search the full frame")
+    parser.add_argument("--calibration", help="JSON file with the camera calibration block")
+    parser.add_argument("--fps", type=float, default=30.0, help="frame rate used for the fake capture times")
+    parser.add_argument("--check-allocations", action="store_true",
+                        help="fail if a pool buffer is allocated, or memory keeps growing, after the warmup frames")
+    args = parser.parse_args()
+
+    frames = list(read_frames(args.source, args.width, args.height))
+    if not frames:
+        print("no frames found in '{}'".format(args.source), file=sys.stderr)
+        sys.exit(1)
+
+    calibration = None
+    if args.calibration:
+        with open(args.calibration, "rt") as f:
+            calibration = json.load(f)
+
+    low_hsv, high_hsv = args.hsv_low, args.hsv_high
+    if args.thresholds:
+        thresholds = load_calibration(args.thresholds)
+        if thresholds is None:
+            sys.exit(1)
+        low_hsv, high_hsv = thresholds["hsv_low"], thresholds["hsv_high"]
+
+    frame_shape = frames[0][1].shape
+    processor = FrameProcessor.create(frame_shape, low_hsv, high_hsv,
+                                      calibration=calibration,
+                                      lut_bits=args.lut_bits,
+                                      roi_tracking=not args.no_roi,
+                                      pool=BufferPool(debug=args.check_allocations))
+    workspace = processor.make_workspace()
+
+    nt = StubTable()
+    clock = StubClock()
+    # An array rather than a list of floats, so --check-allocations only
+    # sees what the processing keeps
+    latencies = numpy.zeros(len(frames))
+
+    start_time = time.time()
+    with open(args.output, "wt") as out:
+        for index, (name, img) in enumerate(frames):
+            capture_time = int((start_time + index / args.fps) * 1e6)
+
+            start = time.perf_counter()
+            result = processor.process(img, workspace)
+            latencies[index] = (time.perf_counter() - start) * 1000.0
+
+            publish_target(nt, clock, result, capture_time)
+
+            try:
+                processor.pool.end_frame()
+            except AllocationError as err:
+                print("frame '{}': {}".format(name, err), file=sys.stderr)
+                sys.exit(1)
+
+            line = dict(zip(RECORD_FIELDS, nt.values["target"]))
+            line["frame"] = index
+            line["name"] = name
+            line["contours"] = result.contour_count
+            line["strips"] = len(result.strips)
+            line["process_ms"] = float(latencies[index])
+            out.write(json.dumps(line) + "\n")
+
+    total_ms = float(latencies.sum())
+    with open(args.output, "rt") as f:
+        found = sum(1 for line in f if json.loads(line)["valid"])
+    alloc_bytes, alloc_blocks = measure_allocations(processor, frames)
+
+    print("frames:       {} ({} with a target)".format(len(frames), found))
+    print("throughput:   {:.1f} fps".format(1000.0 * len(frames) / total_ms if total_ms else 0.0))
+    print("latency p50:  {:.3f} ms".format(percentile(latencies, 50)))
+    print("latency p99:  {:.3f} ms".format(percentile(latencies, 99)))
+    print("allocations:  {:.1f} KB peak, {:.2f} blocks net per frame".format(alloc_bytes / 1024.0, alloc_blocks))
+    print("pool buffers: {} allocated".format(processor.pool.allocations))
+    print("results:      {}".format(args.output))
+
+if __name__ == "__main__":
+    main()
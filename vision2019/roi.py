@@ -0,0 +1,81 @@
+#----------------------------------------------------------------------------
+# Region of interest tracking for the target camera.
+#
+# Once the tape strips have been found there is no point converting and
+# thresholding the whole image on the next frame, the target can only have
+# moved a little.  The tracker hands out a padded window around the last
+# contours and only goes back to a full frame search after a few misses in
+# a row, or every so often to pick up targets that came into view elsewhere.
+#----------------------------------------------------------------------------
+
+import threading
+
+import cv2
+
+class RoiTracker():
+    def __init__(self, width, height, padding=0.5, min_padding=16, max_misses=3, refresh_period=30):
+        self.width = width
+        self.height = height
+
+        # Window padding on each side, as a fraction of the target size
+        # but never less than min_padding pixels
+        self.padding = padding
+        self.min_padding = min_padding
+
+        # Full frame search after this many empty windows in a row...
+        self.max_misses = max_misses
+        # ...and at least once every refresh_period frames
+        self.refresh_period = refresh_period
+
+        self._lock = threading.Lock()
+        self._roi = None
+        self._misses = 0
+        self._frames_since_full = 0
+
+    def full_frame(self):
+        return (0, 0, self.width, self.height)
+
+    def window(self):
+        """Return the (x, y, w, h) window to process for the next frame."""
+        with self._lock:
+            if self._roi is None or self._frames_since_full >= self.refresh_period:
+                self._frames_since_full = 0
+                return self.full_frame()
+            self._frames_since_full += 1
+            return self._roi
+
+    def update(self, window, contours):
+        """Feed back the contours (in full frame coordinates) found in window."""
+        with self._lock:
+            if len(contours) == 0:
+                self._misses += 1
+                if window == self.full_frame() or self._misses >= self.max_misses:
+                    self._roi = None
+                return
+
+            self._misses = 0
+
+            x0, y0 = self.width, self.height
+            x1, y1 = 0, 0
+            for contour in contours:
+                x, y, w, h = cv2.boundingRect(contour)
+                x0 = min(x0, x)
+                y0 = min(y0, y)
+                x1 = max(x1, x + w)
+                y1 = max(y1, y + h)
+
+            pad_x = max(self.min_padding, int((x1 - x0) * self.padding))
+            pad_y = max(self.min_padding, int((y1 - y0) * self.padding))
+
+            x0 = max(0, x0 - pad_x)
+            y0 = max(0, y0 - pad_y)
+            x1 = min(self.width, x1 + pad_x)
+            y1 = min(self.height, y1 + pad_y)
+
+            self._roi = (x0, y0, x1 - x0, y1 - y0)
+
+    def reset(self):
+        with self._lock:
+            self._roi = None
+            self._misses = 0
+            self._frames_since_full = 0
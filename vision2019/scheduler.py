@@ -0,0 +1,154 @@
+#----------------------------------------------------------------------------
+# Shares the coprocessor between several target cameras.
+#
+# Every camera has its own frame rate and CPU budget (the fraction of wall
+# time its processing may use, measured over the last second).  Cameras
+# take turns round-robin, unless the robot says which way it is driving on
+# "drive_direction": then the camera facing that way goes first at its full
+# frame rate and the others drop to their idle frame rate.
+#
+# A camera that stops delivering frames is set aside and retried every
+# few seconds, the other cameras keep running without it.
+#----------------------------------------------------------------------------
+
+import collections
+import time
+
+class CameraTask():
+    """
+    One target camera.  grab(img) works like CvSink.grabFrame() and should
+    time out rather than block, process(img, workspace) returns a result and
+    publish(result, capture_time, img) sends it on.
+    """
+
+    def __init__(self, name, grab, processor, publish, fps=30.0, cpu_budget=1.0, direction=0,
+                 idle_fps=5.0, max_failures=5, retry_period=2.0, window=1.0):
+        self.name = name
+        self.grab = grab
+        self.processor = processor
+        self.publish = publish
+        self.fps = fps
+        self.cpu_budget = cpu_budget
+        # 1 faces forward, -1 backward, 0 neither
+        self.direction = direction
+        self.idle_fps = idle_fps
+        self.max_failures = max_failures
+        self.retry_period = retry_period
+        self.window = window
+
+        # Allocating new images is very expensive, always try to preallocate
+        self.img = processor.pool.acquire(processor.frame_shape)
+        self.workspace = processor.make_workspace()
+
+        self.available = True
+        self.failures = 0
+        self.retry_at = 0.0
+        self.next_due = 0.0
+        self.last_run = 0.0
+
+        # (finish time, seconds) of every processed frame in the window
+        self._busy = collections.deque()
+        self.frames = 0
+        self.over_budget = 0
+
+    def period(self, preferred):
+        fps = self.fps if preferred else min(self.fps, self.idle_fps)
+        return 1.0 / fps
+
+    def cpu_used(self, now):
+        while self._busy and self._busy[0][0] < now - self.window:
+            self._busy.popleft()
+        return sum(seconds for _, seconds in self._busy) / self.window
+
+    def ready(self, now):
+        if not self.available:
+            return now >= self.retry_at
+        return now >= self.next_due
+
+    def run(self, now, preferred, clock):
+        """Grab, process and publish one frame.  Returns False if the grab failed."""
+        self.last_run = now
+        self.next_due = now + self.period(preferred)
+
+        capture_time, img = self.grab(self.img)
+        if capture_time == 0:
+            self.failures += 1
+            if self.available and self.failures >= self.max_failures:
+                print("Camera '{}' stopped delivering frames".format(self.name))
+                self.available = False
+            if not self.available:
+                self.retry_at = clock() + self.retry_period
+            return False
+
+        if not self.available:
+            print("Camera '{}' is back".format(self.name))
+        self.available = True
+        self.failures = 0
+        self.img = img
+
+        start = clock()
+        result = self.processor.process(img, self.workspace)
+        self.publish(result, capture_time, img)
+        finish = clock()
+
+        self._busy.append((finish, finish - start))
+        self.frames += 1
+        self.processor.pool.end_frame()
+        return True
+
+class CameraScheduler():
+    def __init__(self, tasks, direction=lambda: 0, clock=time.monotonic, sleep=time.sleep, idle_sleep=0.005):
+        self.tasks = list(tasks)
+        self.direction = direction
+        self.clock = clock
+        self.sleep = sleep
+        self.idle_sleep = idle_sleep
+
+    def preferred(self):
+        """The camera facing the way the robot drives, None for round-robin."""
+        direction = self.direction()
+        if not direction:
+            return None
+        for task in self.tasks:
+            if task.available and task.direction * direction > 0:
+                return task
+        return None
+
+    def next_task(self, now):
+        preferred = self.preferred()
+
+        candidates = []
+        for task in self.tasks:
+            if not task.ready(now):
+                continue
+            if task.available and task.cpu_used(now) >= task.cpu_budget:
+                task.over_budget += 1
+                continue
+            candidates.append(task)
+
+        if not candidates:
+            return None, preferred
+        if preferred in candidates:
+            return preferred, preferred
+
+        # Round-robin: whoever has waited longest
+        return min(candidates, key=lambda task: task.last_run), preferred
+
+    def run_once(self):
+        now = self.clock()
+        task, preferred = self.next_task(now)
+        if task is None:
+            self.sleep(self.idle_sleep)
+            return None
+
+        task.run(now, preferred is None or task is preferred, self.clock)
+        return task
+
+    def run(self, running=lambda: True):
+        while running():
+            self.run_once()
+
+    def report(self):
+        """Return {camera name: (frames, cpu fraction, available)}."""
+        now = self.clock()
+        return {task.name: (task.frames, task.cpu_used(now), task.available) for task in self.tasks}
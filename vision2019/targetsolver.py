@@ -0,0 +1,195 @@
+#----------------------------------------------------------------------------
+# Deep Space target solver.
+#
+# Takes the contours found in the threshold image, keeps the ones that look
+# like a strip of retroreflective tape, pairs the left and right leaning
+# strips of a vision target and solves for the camera pose relative to the
+# target with solvePnP.  The result goes out as one number array so the
+# robot always reads yaw, distance and skew from the same frame.
+#----------------------------------------------------------------------------
+
+import math
+import time
+
+import numpy
+import cv2
+
+# Vision target geometry from the game manual, in inches.  Each strip is
+# rotated 14.5 degrees toward the other one and the strips are 8 inches
+# apart at their closest point (the top).
+STRIP_WIDTH = 2.0
+STRIP_LENGTH = 5.5
+STRIP_ANGLE = math.radians(14.5)
+STRIP_GAP = 8.0
+
+# Contour filters
+MIN_AREA = 20.0
+MIN_ASPECT = 1.5
+MAX_ASPECT = 6.0
+MIN_FILL = 0.6
+
+# Horizontal field of view used when a camera has no calibration,
+# roughly right for the Lifecam HD-3000
+DEFAULT_HFOV = math.radians(61.0)
+
+# Layout of the published record, the timestamp is the capture time
+# converted to robot FPGA time (0 when the clocks are not synchronized)
+RECORD_FIELDS = ("timestamp", "valid", "yaw", "distance", "skew", "solver_ms")
+
+"""Order the 4 corners of a tilted rectangle as top, right, bottom, left."""
+def ordered_corners(points):
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    return numpy.array((points[numpy.argmin(points[:, 1])],
+                        points[numpy.argmax(points[:, 0])],
+                        points[numpy.argmax(points[:, 1])],
+                        points[numpy.argmin(points[:, 0])]))
+
+"""Target model points in inches, x right, y down, centered on the target."""
+def target_model():
+    c = math.cos(STRIP_ANGLE)
+    s = math.sin(STRIP_ANGLE)
+    w = STRIP_WIDTH / 2
+    l = STRIP_LENGTH / 2
+
+    # Left strip rotated so its top leans toward the middle of the target
+    strip = numpy.array([(x * c - y * s, x * s + y * c) for x, y in ((-w, -l), (w, -l), (w, l), (-w, l))])
+    center = STRIP_GAP / 2 + strip[:, 0].max()
+
+    left = strip + (-center, 0.0)
+    right = left * (-1.0, 1.0)
+
+    model = numpy.vstack((ordered_corners(left), ordered_corners(right)))
+    return numpy.hstack((model, numpy.zeros((8, 1))))
+
+class CameraIntrinsics():
+    def __init__(self, camera_matrix, dist_coeffs):
+        self.camera_matrix = numpy.array(camera_matrix, dtype=numpy.float64).reshape(3, 3)
+        self.dist_coeffs = numpy.array(dist_coeffs, dtype=numpy.float64).reshape(-1, 1)
+
+    @classmethod
+    def from_fov(cls, width, height, hfov=DEFAULT_HFOV):
+        f = (width / 2) / math.tan(hfov / 2)
+        return cls(((f, 0, width / 2), (0, f, height / 2), (0, 0, 1)), (0, 0, 0, 0, 0))
+
+    @classmethod
+    def from_config(cls, config, width, height):
+        """
+        Read the optional "calibration" block of a camera config:
+        {"width": .., "height": .., "camera_matrix": [[..]], "distortion": [..]}
+        The camera matrix is rescaled if the calibration was done at another
+        resolution.
+        """
+        if not config:
+            return cls.from_fov(width, height)
+
+        matrix = numpy.array(config["camera_matrix"], dtype=numpy.float64).reshape(3, 3)
+        sx = width / config.get("width", width)
+        sy = height / config.get("height", height)
+        matrix[0] *= sx
+        matrix[1] *= sy
+        return cls(matrix, config.get("distortion", (0, 0, 0, 0, 0)))
+
+class Strip():
+    __slots__ = ("contour", "center", "corners", "leans_right")
+
+    def __init__(self, contour, rect):
+        self.contour = contour
+        self.center = rect[0]
+
+        box = cv2.boxPoints(rect)
+        self.corners = ordered_corners(box)
+
+        # Direction of the long side, pointing up the image
+        side_a = box[1] - box[0]
+        side_b = box[2] - box[1]
+        dx, dy = side_a if numpy.hypot(*side_a) > numpy.hypot(*side_b) else side_b
+        if dy > 0:
+            dx = -dx
+        self.leans_right = dx > 0
+
+class TargetResult():
+    __slots__ = ("valid", "yaw", "distance", "skew", "solver_ms", "contour_count", "strips", "pair")
+
+    def __init__(self):
+        self.valid = False
+        self.yaw = 0.0
+        self.distance = 0.0
+        self.skew = 0.0
+        self.solver_ms = 0.0
+        self.contour_count = 0
+        self.strips = []
+        self.pair = None
+
+    def record(self, timestamp):
+        return (timestamp, 1.0 if self.valid else 0.0, self.yaw, self.distance, self.skew, self.solver_ms)
+
+class TargetSolver():
+    MODEL = target_model()
+
+    def __init__(self, intrinsics, width):
+        self.intrinsics = intrinsics
+        self.width = width
+
+    def filter_strips(self, contours):
+        strips = []
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area < MIN_AREA:
+                continue
+
+            rect = cv2.minAreaRect(contour)
+            w, h = rect[1]
+            if w == 0 or h == 0:
+                continue
+
+            aspect = max(w, h) / min(w, h)
+            if aspect < MIN_ASPECT or aspect > MAX_ASPECT:
+                continue
+
+            if area / (w * h) < MIN_FILL:
+                continue
+
+            strips.append(Strip(contour, rect))
+        return strips
+
+    def pair_strips(self, strips):
+        """Pick the left/right leaning pair closest to the middle of the image."""
+        strips = sorted(strips, key=lambda strip: strip.center[0])
+
+        best = None
+        best_offset = None
+        for left, right in zip(strips, strips[1:]):
+            if not left.leans_right or right.leans_right:
+                continue
+            offset = abs((left.center[0] + right.center[0]) / 2 - self.width / 2)
+            if best is None or offset < best_offset:
+                best = (left, right)
+                best_offset = offset
+        return best
+
+    def solve(self, contours):
+        start = time.monotonic()
+        result = TargetResult()
+        result.contour_count = len(contours)
+
+        result.strips = self.filter_strips(contours)
+        result.pair = self.pair_strips(result.strips)
+
+        if result.pair is not None:
+            image_points = numpy.vstack((result.pair[0].corners, result.pair[1].corners))
+            ok, rvec, tvec = cv2.solvePnP(self.MODEL, image_points,
+                                          self.intrinsics.camera_matrix, self.intrinsics.dist_coeffs)
+            if ok:
+                x, _, z = tvec.ravel()
+                result.yaw = math.degrees(math.atan2(x, z))
+                result.distance = math.hypot(x, z)
+
+                # Where the camera is in the target's frame gives the skew,
+                # the target's z axis points into the wall
+                rotation, _ = cv2.Rodrigues(rvec)
+                camera = -rotation.T.dot(tvec).ravel()
+                result.skew = math.degrees(math.atan2(camera[0], -camera[2]))
+                result.valid = True
+
+        result.solver_ms = (time.monotonic() - start) * 1000.0
+        return result
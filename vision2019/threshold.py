@@ -0,0 +1,102 @@
+#----------------------------------------------------------------------------
+# Color thresholding engines for the target camera.
+#
+# HsvThreshold is the original cvtColor + inRange path.  LutThreshold gets
+# the same mask straight from the BGR image: every BGR color is quantized to
+# `bits` bits per channel and looked up in a table that was built once from
+# the HSV limits, so there is no 3 channel HSV image written every frame.
+# OpenCV's vectorized cvtColor + inRange still beats the table on a laptop
+# (about 1.8x at 640x480), so HsvThreshold stays the default and the table
+# is only worth turning on if bench_threshold.py says so on the Pi.
+#
+# Both engines have the same interface, make_workspace(shape, pool) takes
+# the per-thread scratch buffers from a BufferPool and apply() thresholds
+# an image into dst.
+#----------------------------------------------------------------------------
+
+import threading
+
+import numpy
+import cv2
+
+class HsvThreshold():
+    def __init__(self, low_hsv, high_hsv):
+        self.set_thresholds(low_hsv, high_hsv)
+
+    def set_thresholds(self, low_hsv, high_hsv):
+        self.low_limit_hsv = numpy.array(low_hsv, dtype=numpy.uint8)
+        self.high_limit_hsv = numpy.array(high_hsv, dtype=numpy.uint8)
+
+    def make_workspace(self, shape, pool):
+        return pool.acquire(shape, numpy.uint8)
+
+    def apply(self, img, dst, workspace):
+        h, w = img.shape[:2]
+        hsv_frame = cv2.cvtColor(img, cv2.COLOR_BGR2HSV, dst=workspace[:h, :w])
+        return cv2.inRange(hsv_frame, self.low_limit_hsv, self.high_limit_hsv, dst=dst)
+
+class LutThreshold():
+    """
+    BGR -> mask lookup table threshold.  bits=5 gives a 2^15 entry (32 KB)
+    table, bits=6 a 2^18 entry (256 KB) table that follows the HSV limits
+    more closely at the cost of more cache misses.
+    """
+
+    def __init__(self, low_hsv, high_hsv, bits=5):
+        self.bits = bits
+        self.shift = 8 - bits
+        # The packed 15 or 18 bit index, a quarter or half the memory traffic
+        # of intp.  take() still widens it internally, but that costs less
+        # than building the index in intp
+        self.index_dtype = numpy.uint16 if 3 * bits <= 16 else numpy.uint32
+
+        self._lock = threading.Lock()
+        self._limits = None
+        self.lut = None
+        self.rebuilds = 0
+        self.set_thresholds(low_hsv, high_hsv)
+
+    def set_thresholds(self, low_hsv, high_hsv):
+        """Rebuild the table, but only if the limits actually changed."""
+        limits = (tuple(int(v) for v in low_hsv), tuple(int(v) for v in high_hsv))
+        with self._lock:
+            if limits == self._limits:
+                return False
+
+            # Threshold the center of every quantized BGR cell once
+            levels = 1 << self.bits
+            values = (numpy.arange(levels, dtype=numpy.uint16) << self.shift) + ((1 << self.shift) >> 1)
+            b, g, r = numpy.meshgrid(values, values, values, indexing="ij")
+            colors = numpy.stack((b, g, r), axis=-1).astype(numpy.uint8).reshape(-1, 1, 3)
+
+            hsv = cv2.cvtColor(colors, cv2.COLOR_BGR2HSV)
+            lut = cv2.inRange(hsv, numpy.array(limits[0], dtype=numpy.uint8), numpy.array(limits[1], dtype=numpy.uint8))
+
+            # Swap in the new table in one go, apply() on other threads
+            # keeps using the old one until it is done with the frame
+            self.lut = lut.reshape(-1)
+            self._limits = limits
+            self.rebuilds += 1
+            return True
+
+    def make_workspace(self, shape, pool):
+        return (pool.acquire(shape, numpy.uint8),
+                pool.acquire(shape[:2], self.index_dtype),
+                pool.acquire(shape[:2], self.index_dtype))
+
+    def apply(self, img, dst, workspace):
+        h, w = img.shape[:2]
+        quantized, index, scratch = workspace
+        quantized = quantized[:h, :w]
+        index = index[:h, :w]
+        scratch = scratch[:h, :w]
+
+        # index = b << 2 * bits | g << bits | r, all into preallocated buffers
+        numpy.right_shift(img, self.shift, out=quantized)
+        numpy.left_shift(quantized[..., 0], 2 * self.bits, out=index, dtype=self.index_dtype)
+        numpy.left_shift(quantized[..., 1], self.bits, out=scratch, dtype=self.index_dtype)
+        numpy.bitwise_or(index, scratch, out=index)
+        numpy.bitwise_or(index, quantized[..., 2], out=index)
+
+        # mode="clip" stops take() from buffering the output, every index is in range anyway
+        return numpy.take(self.lut, index, out=dst, mode="clip")
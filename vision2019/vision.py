@@ -7,16 +7,22 @@
 #----------------------------------------------------------------------------
 
 import json
+import os
 import time
 import sys
 
-import numpy
-import cv2
-
 from cscore import CameraServer, VideoSource, UsbCamera, MjpegServer
 from networktables import NetworkTablesInstance
 from networktables import NetworkTables
 
+from pipeline import VisionPipeline
+from processing import FrameProcessor, publish_target
+from bufferpool import BufferPool
+from clocksync import ClockOffsetEstimator
+from calibration import sweep, load_calibration, save_calibration, apply_camera_settings
+from scheduler import CameraTask, CameraScheduler
+from dashboardstream import DashboardStream
+
 #   JSON format:
 #   {
 #       "team": <team number>,
@@ -45,6 +51,11 @@ from networktables import NetworkTables
 #                           "value": <stream property value>
 #                       }
 #                   ]
+#               },
+#               "target": {                              // optional
+#                   "fps": <frames per second to process>
+#                   "cpu budget": <fraction of the CPU it may use>
+#                   "direction": <1 facing forward, -1 backward>
 #               }
 #           }
 #       ]
@@ -65,6 +76,58 @@ S_HIGH = 244
 V_LOW = 73
 V_HIGH = 136
 
+# Calibrated HSV limits and camera settings, used instead of the limits
+# above once they exist.  Calibration runs at startup when
+# CALIBRATE_AT_STARTUP is set or "calibrate" is true on the vision table,
+# and never takes longer than CALIBRATION_BUDGET seconds.  Up to
+# NT_CONNECT_TIMEOUT of that is spent waiting for NetworkTables to connect,
+# so "calibrate" and "calibration_roi" come from the dashboard.
+CALIBRATION_FILE = "/home/pi/vision_calibration.json"
+CALIBRATE_AT_STARTUP = False
+CALIBRATION_BUDGET = 5.0
+NT_CONNECT_TIMEOUT = 2.0
+
+# Run grab, processing and publishing on separate threads instead of
+# one after the other.  PIPELINE_WORKERS processing threads share the work.
+# Only used with a single target camera, several share the CameraScheduler.
+PIPELINE_MODE = True
+PIPELINE_WORKERS = 2
+PIPELINE_DEPTH = 2
+STATS_PERIOD = 1.0
+
+# Cameras with a "target" block in the config are processed.  Older configs
+# don't have one, then it is the camera plugged in at TARGET_CAMERA_PATH.
+TARGET_CAMERA_PATH = "usb-0:1.3:1.0"
+TARGET_FPS = 30.0
+TARGET_CPU_BUDGET = 0.8
+# Frame rate of the cameras not facing the way the robot drives
+IDLE_FPS = 5.0
+# Don't let a missing camera hold up the others
+GRAB_TIMEOUT = 0.1
+
+# Dashboard stream of the target cameras.  Every STREAM_SKIP-th frame is
+# shrunk to STREAM_WIDTH x STREAM_HEIGHT, annotated and streamed at
+# STREAM_QUALITY (JPEG, 0-100) off the processing threads.
+STREAM_WIDTH = 160
+STREAM_HEIGHT = 120
+STREAM_QUALITY = 30
+STREAM_SKIP = 2
+
+# Fail if any image buffer is allocated, or memory keeps being allocated and
+# not freed, once the pipeline has warmed up
+BUFFER_POOL_DEBUG = False
+
+# Only process a padded window around the last target once it is found
+ROI_TRACKING = True
+ROI_MAX_MISSES = 3
+ROI_REFRESH_PERIOD = 30
+
+# Threshold with a BGR lookup table instead of cvtColor + inRange.
+# LUT_BITS is the number of bits kept per color channel (5 or 6).
+# Run bench_threshold.py on the Pi to see which one is faster there.
+LUT_THRESHOLD = False
+LUT_BITS = 5
+
 class CameraConfig: pass
 
 """Report parse error."""
@@ -92,6 +155,12 @@ def readCameraConfig(config):
     # stream properties
     cam.streamConfig = config.get("stream")
 
+    # lens calibration (optional), used by the target solver
+    cam.calibration = config.get("calibration")
+
+    # target processing (optional)
+    cam.target = config.get("target")
+
     cam.config = config
 
     cameraConfigs.append(cam)
@@ -162,62 +231,212 @@ def startCameras():
 
         cameras.append(camera)
 
+"""Publish the frame rate, CPU use and health of every target camera."""
+def publishSchedulerStats(nt, scheduler, last_frames):
+    available = 0
+    for name, (frames, cpu, ok) in scheduler.report().items():
+        nt.putNumber("camera_{}_fps".format(name), (frames - last_frames.get(name, 0)) / STATS_PERIOD)
+        nt.putNumber("camera_{}_cpu".format(name), cpu)
+        nt.putBoolean("camera_{}_ok".format(name), ok)
+        last_frames[name] = frames
+        available += ok
+    nt.putNumber("target_cameras", available)
+
+"""Publish the dashboard stream frame rate, bandwidth and encode time."""
+def publishStreamStats(nt, stream, last_streamed):
+    fps = (stream.streamed - last_streamed) / STATS_PERIOD
+    nt.putNumber("stream_fps", fps)
+    nt.putNumber("stream_mbps", stream.bandwidth(fps))
+    nt.putNumber("stream_encode_ms", stream.encode_ms)
+    return stream.streamed
+
+"""Publish the per-stage pipeline latency to NetworkTables."""
+def publishPipelineStats(nt, pipeline):
+    report = pipeline.report()
+    for stage in VisionPipeline.STAGES:
+        mean_ms, max_ms = report[stage]
+        nt.putNumber("latency_{}_ms".format(stage), mean_ms)
+        nt.putNumber("latency_{}_max_ms".format(stage), max_ms)
+    nt.putNumber("dropped_frames", report["dropped_process"] + report["dropped_publish"] + report["out_of_order"])
+    return report
+
+"""Wait up to timeout seconds for the client to connect, returns the time waited."""
+def waitForConnection(timeout):
+    start = time.monotonic()
+    if server:
+        return 0.0
+
+    ntinst = NetworkTablesInstance.getDefault()
+    while not ntinst.isConnected() and time.monotonic() - start < timeout:
+        time.sleep(0.05)
+    if not ntinst.isConnected():
+        print("NetworkTables not connected after {} s, using the local calibration settings".format(timeout), file=sys.stderr)
+    return time.monotonic() - start
+
+"""
+Return the (low, high) HSV limits to use, calibrating the camera first if
+that was asked for.
+"""
+def calibrateThreshold(nt, camera, cvSink, frame_shape):
+    # Until the client has connected every read gets the local default
+    budget = CALIBRATION_BUDGET - waitForConnection(min(NT_CONNECT_TIMEOUT, CALIBRATION_BUDGET))
+
+    if CALIBRATE_AT_STARTUP or nt.getBoolean("calibrate", False):
+        height, width = frame_shape[:2]
+        # The operator selects the target region from the dashboard,
+        # otherwise the target has to be in the middle of the picture
+        roi = nt.getNumberArray("calibration_roi", (width // 3, height // 3, width // 3, height // 3))
+
+        print("Calibrating target camera for up to {:.1f} s".format(budget))
+        result = sweep(camera, cvSink, frame_shape, roi, budget)
+        if result is None:
+            print("Calibration failed, no target in the region", file=sys.stderr)
+        else:
+            print("Calibrated: {}".format(json.dumps(result.to_json())))
+            save_calibration(CALIBRATION_FILE, result)
+        nt.putBoolean("calibrate", False)
+
+    if os.path.exists(CALIBRATION_FILE):
+        calibration = load_calibration(CALIBRATION_FILE)
+        if calibration is not None:
+            apply_camera_settings(camera, calibration)
+            nt.putNumberArray("hsv_low", calibration["hsv_low"])
+            nt.putNumberArray("hsv_high", calibration["hsv_high"])
+            return tuple(calibration["hsv_low"]), tuple(calibration["hsv_high"])
+
+    return (H_LOW, S_LOW, V_LOW), (H_HIGH, S_HIGH, V_HIGH)
+
+"""Pair up the target cameras with their configs."""
+def findTargetCameras():
+    targets = [(config, camera) for config, camera in zip(cameraConfigs, cameras) if config.target is not None]
+    if not targets:
+        for config, camera in zip(cameraConfigs, cameras):
+            if TARGET_CAMERA_PATH in camera.getPath():
+                config.target = {}
+                targets.append((config, camera))
+    return targets
+
 def main_loop():
     global cs
 
-    hsv_frame = None
-    threshold_frame = None
-
     nt = NetworkTables.getTable("team63_vision_table")
 
-    target_cam = None
-    for camera in cameras:
-        if "usb-0:1.3:1.0" in camera.getPath():
-            target_cam = camera
-
-    if target_cam is None:
-        print("Could not find target camera!!!!")
-        sys.exit(1)
+    clock = ClockOffsetEstimator(nt)
+    clock.start()
 
-    # Get a CvSink. This will capture images from the camera
-    cvSink = cs.getVideo(camera=target_cam)
+    # All image buffers come from here
+    pool = BufferPool(debug=BUFFER_POOL_DEBUG)
 
-    # Setup a CvSource. This will send images back to the Dashboard
-    outputStream = cs.putVideo("target", target_cam.getVideoMode().width, target_cam.getVideoMode().height)
+    tasks = []
+    low_hsv = high_hsv = None
+    for config, camera in findTargetCameras():
+        mode = camera.getVideoMode()
+        frame_shape = (mode.height, mode.width, 3)
 
-    # Allocating new images is very expensive, always try to preallocate
-    img = numpy.zeros(shape=(target_cam.getVideoMode().height, target_cam.getVideoMode().width, 3), dtype=numpy.uint8)
-    hsv_frame = numpy.empty(shape=img.shape, dtype=numpy.uint8)
-    threshold_frame = numpy.empty(shape=img.shape[:2], dtype=numpy.uint8)
-
-    # Color threshold values, in HSV space
-    low_limit_hsv = numpy.array((H_LOW, S_LOW, V_LOW), dtype=numpy.uint8)
-    high_limit_hsv = numpy.array((H_HIGH, S_HIGH, V_HIGH), dtype=numpy.uint8)
+        # Get a CvSink. This will capture images from the camera
+        cvSink = cs.getVideo(camera=camera)
 
+        # The first target camera publishes on the vision table itself as it
+        # always has, any others on a sub table named after the camera
+        if not tasks:
+            table = nt
+            stream_name = "target"
+        else:
+            table = nt.getSubTable(config.name)
+            stream_name = "target_" + config.name
+
+        # Setup a CvSource. This will send images back to the Dashboard
+        outputStream = cs.putVideo(stream_name, STREAM_WIDTH, STREAM_HEIGHT)
+        cs.getServer("serve_" + stream_name).setDefaultCompression(STREAM_QUALITY)
+        stream = DashboardStream(outputStream, STREAM_WIDTH, STREAM_HEIGHT,
+                                 quality=STREAM_QUALITY, skip=STREAM_SKIP, stats_period=STATS_PERIOD, pool=pool)
+        stream.start()
+
+        # Color threshold values, in HSV space, calibrated on the first camera
+        if low_hsv is None:
+            low_hsv, high_hsv = calibrateThreshold(nt, camera, cvSink, frame_shape)
+
+        processor = FrameProcessor.create(frame_shape, low_hsv, high_hsv,
+                                          calibration=config.calibration,
+                                          lut_bits=LUT_BITS if LUT_THRESHOLD else None,
+                                          roi_tracking=ROI_TRACKING,
+                                          roi_max_misses=ROI_MAX_MISSES,
+                                          roi_refresh_period=ROI_REFRESH_PERIOD,
+                                          pool=pool)
+
+        tasks.append((config, cvSink, stream, table, processor))
+
+    if not tasks:
+        # Keep going so the driver camera still streams
+        print("Could not find target camera!!!!", file=sys.stderr)
+
+    if PIPELINE_MODE and len(tasks) == 1:
+        _, cvSink, stream, table, processor = tasks[0]
+        pipeline_loop(table, clock, cvSink, stream, processor)
+        return
+
+    scheduler_loop(nt, clock, tasks)
+
+"""Share the processing between the target cameras, one frame at a time."""
+def scheduler_loop(nt, clock, tasks):
+    def make_task(config, cvSink, stream, table, processor):
+        def grab(img):
+            capture_time, img = cvSink.grabFrame(img, GRAB_TIMEOUT)
+            if capture_time == 0:
+                stream.output.notifyError(cvSink.getError())
+            return capture_time, img
+
+        def publish(result, capture_time, img):
+            publish_target(table, clock, result, capture_time)
+            # Give the output stream a new image to display
+            stream.offer(img, result)
+
+        return CameraTask(config.name, grab, processor, publish,
+                          fps=config.target.get("fps", TARGET_FPS),
+                          cpu_budget=config.target.get("cpu budget", TARGET_CPU_BUDGET),
+                          direction=config.target.get("direction", 0),
+                          idle_fps=IDLE_FPS)
+
+    scheduler = CameraScheduler([make_task(*task) for task in tasks],
+                                direction=lambda: nt.getNumber("drive_direction", 0))
+
+    last_frames = {}
+    last_streamed = [0] * len(tasks)
+    next_stats = time.monotonic() + STATS_PERIOD
     while True:
-        # Tell the CvSink to grab a frame from the camera and put it
-        # in the source image.  If there is an error notify the output.
-        time, img = cvSink.grabFrame(img)
-        if time == 0:
-            # Send the output the error.
-            outputStream.notifyError(cvSink.getError())
-            # skip the rest of the current iteration
-            continue
-
-        hsv_frame = cv2.cvtColor(img, cv2.COLOR_BGR2HSV, dst=hsv_frame)
-        threshold_frame = cv2.inRange(hsv_frame, low_limit_hsv, high_limit_hsv,
-                                           dst=threshold_frame)
-
-        # OpenCV 3 returns 3 parameters!
-        # Only need the contours variable
-        _, contours, _ = cv2.findContours(threshold_frame, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        nt.putNumber("count_contours", len(contours))
-
-        cv2.rectangle(img, (100, 100), (300, 300), (255, 255, 255), 5)
-
-        # Give the output stream a new image to display
-        outputStream.putFrame(img)
+        scheduler.run_once()
+
+        if time.monotonic() >= next_stats:
+            next_stats += STATS_PERIOD
+            publishSchedulerStats(nt, scheduler, last_frames)
+            for i, (_, _, stream, table, _) in enumerate(tasks):
+                last_streamed[i] = publishStreamStats(table, stream, last_streamed[i])
+
+"""Run the grab/process/publish stages on their own threads."""
+def pipeline_loop(nt, clock, cvSink, stream, processor):
+    def grab(img):
+        capture_time, img = cvSink.grabFrame(img)
+        if capture_time == 0:
+            stream.output.notifyError(cvSink.getError())
+        return capture_time, img
+
+    def publish(frame):
+        publish_target(nt, clock, frame.result, frame.capture_time)
+        stream.offer(frame.img, frame.result)
+
+    # Every processing thread gets its own preallocated scratch images
+    pipeline = VisionPipeline(grab, processor.process, publish, processor.frame_shape, processor.make_workspace,
+                              workers=PIPELINE_WORKERS, depth=PIPELINE_DEPTH, pool=processor.pool)
+    pipeline.start()
+
+    last_published = 0
+    last_streamed = 0
+    while pipeline.is_alive():
+        time.sleep(STATS_PERIOD)
+        report = publishPipelineStats(nt, pipeline)
+        nt.putNumber("pipeline_fps", (report["published"] - last_published) / STATS_PERIOD)
+        last_published = report["published"]
+        last_streamed = publishStreamStats(nt, stream, last_streamed)
 
 if __name__ == "__main__":
     if len(sys.argv) >= 2: